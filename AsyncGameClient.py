@@ -0,0 +1,141 @@
+import asyncio
+
+import GameClient
+import lobbyHandlers
+from GameClient import lobby_of
+from tickScheduler import TickScheduler
+from transport import create_client
+
+
+class AsyncGameServer():
+    def __init__(self, client=None, round_seconds=None, max_cells=lobbyHandlers.MAX_BOARD_CELLS):
+        """
+        Game server running on an asyncio loop. Messages of each lobby are handled in order by that lobby's task,
+        different lobbies interleave, and publishes are queued for a separate task instead of sent inline
+        :param client: paho client to publish with, the publishes stay in self.published when None
+        :param round_seconds: round length of lobbies that do not set one, None waits for every move
+        :param max_cells: largest board a lobby may ask for
+        """
+        self.client = client
+        lobbyHandlers.init_lobby_state(self)
+        self.round_seconds = round_seconds
+        self.max_cells = max_cells
+        self.ticks = TickScheduler()
+        self.ticks_changed = asyncio.Event()
+        self.lobby_queues: dict[str, asyncio.Queue] = {}
+        self.lobby_tasks: dict[str, asyncio.Task] = {}
+        self.publish_queue: asyncio.Queue = asyncio.Queue()
+        self.published = []
+        self.loop = None
+
+    # Called by the handlers of lobbyHandlers, never blocks
+    def publish(self, topic, payload=None):
+        self.publish_queue.put_nowait((topic, payload))
+
+    # paho callback, runs on the paho network thread
+    def on_message(self, client, userdata, msg):
+        self.loop.call_soon_threadsafe(self.route, msg.topic, msg.payload)
+
+    def route(self, topic, payload):
+        """
+            Queues a message for the task of its lobby, starting the task if the lobby has none
+        """
+        topic_list = topic.split("/")
+        if topic_list[-1] not in dispatch.keys():
+            return
+        lobby_name = lobby_of(topic_list, payload)
+        if lobby_name is None:
+            return
+        if lobby_name not in self.lobby_queues:
+            self.lobby_queues[lobby_name] = asyncio.Queue()
+            self.lobby_tasks[lobby_name] = asyncio.create_task(self.run_lobby(lobby_name))
+        self.lobby_queues[lobby_name].put_nowait((topic_list, payload))
+
+    async def run_lobby(self, lobby_name):
+        queue = self.lobby_queues[lobby_name]
+        while True:
+            topic_list, payload = await queue.get()
+            try:
+                await dispatch[topic_list[-1]](self, topic_list, payload)
+            except Exception as e:
+                print(f"Error in lobby {lobby_name}: {e}")
+            # Handling a message may have moved a deadline
+            self.ticks_changed.set()
+            # Drop the task of a finished lobby once nothing else is waiting for it
+            if lobby_name not in self.team_dict and queue.empty():
+                self.lobby_queues.pop(lobby_name)
+                self.lobby_tasks.pop(lobby_name)
+                return
+
+    async def run_publisher(self):
+        while True:
+            topic, payload = await self.publish_queue.get()
+            if self.client is None:
+                self.published.append((topic, payload))
+            else:
+                self.client.publish(topic, payload)
+
+    async def run_ticks(self):
+        """
+            Queues a tick message for every lobby whose round deadline passed
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self.ticks_changed.wait(), self.ticks.timeUntilNext())
+            except asyncio.TimeoutError:
+                pass
+            self.ticks_changed.clear()
+            for lobby_name in self.ticks.popDue():
+                self.route(f'games/{lobby_name}/tick', b'')
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        if self.client is not None:
+            # paho keeps its network loop on its own thread and hands messages over to this loop
+            self.client.loop_start()
+        await asyncio.gather(self.run_publisher(), self.run_ticks())
+
+
+# Coroutine versions of the handlers of lobbyHandlers, a lobby's task awaits them one message at a time
+async def add_player(server, topic_list, msg_payload):
+    lobbyHandlers.add_player(server, topic_list, msg_payload)
+
+
+async def player_move(server, topic_list, msg_payload):
+    lobbyHandlers.player_move(server, topic_list, msg_payload)
+
+
+async def start_game(server, topic_list, msg_payload):
+    lobbyHandlers.start_game(server, topic_list, msg_payload)
+
+
+async def player_ack(server, topic_list, msg_payload):
+    lobbyHandlers.player_ack(server, topic_list, msg_payload)
+
+
+async def round_deadline(server, topic_list, msg_payload):
+    lobbyHandlers.round_deadline(server, topic_list, msg_payload)
+
+
+dispatch = {
+    'new_game' : add_player,
+    'move' : player_move,
+    'start' : start_game,
+    'ack' : player_ack,
+    'tick' : round_deadline,
+}
+
+
+if __name__ == '__main__':
+    client = create_client("GameClient")
+
+    server = AsyncGameServer(client)
+    client.on_message = server.on_message
+    client.on_subscribe = GameClient.on_subscribe
+
+    client.subscribe("new_game")
+    client.subscribe('games/+/start')
+    client.subscribe('games/+/+/move')
+    client.subscribe('games/+/+/ack')
+
+    asyncio.run(server.run())
@@ -1,15 +1,16 @@
-import os
 import json
-import copy
-from collections import OrderedDict
-
-import paho.mqtt.client as paho
-from paho import mqtt
-from dotenv import load_dotenv
+import zlib
+import queue
+import argparse
+import threading
+import multiprocessing
 
 from InputTypes import NewPlayer
-from game import Game
-from moveset import Moveset
+from tickScheduler import TickScheduler
+from transport import create_client
+import GameInstanceManger
+from lobbyHandlers import (MAX_BOARD_CELLS, handle_message, dispatch, add_player, start_game, parse_start,
+                           apply_start, board_too_big, remove_lobby, init_lobby_state)
 
 # setting callbacks for different events to see if it works, print the message etc.
 def on_connect(client, userdata, flags, rc, properties=None):
@@ -58,160 +59,236 @@ def on_message(client, userdata, msg):
         :param msg: the message with topic and payload
     """
     print("message: " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
-    topic_list = msg.topic.split("/")
-
-    # Validate it is input we can deal with
-    if topic_list[-1] in dispatch.keys(): 
-        dispatch[topic_list[-1]](client, topic_list, msg.payload)
+    # Round deadlines are handled on the tick thread
+    with client.lobby_lock:
+        handle_message(client, msg.topic, msg.payload)
 
 
+def on_tick(client, lobby_name):
+    """
+        Resolves the round of a lobby whose deadline passed ( used as callback for TickScheduler.runForever )
+    """
+    with client.lobby_lock:
+        handle_message(client, f'games/{lobby_name}/tick', b'')
 
-# Dispatched function, adds player to a lobby & team
-def add_player(client, topic_list, msg_payload):
-    # Parse and Validate Input Data
-    try:
-        player = NewPlayer(**json.loads(msg_payload))
-    except:
-        print("ValidationError in create_game")
-        return
-    
-    # If lobby doesn't exists...
-    if player.lobby_name not in client.team_dict.keys():
-        client.team_dict[player.lobby_name] = {}
-        client.team_dict[player.lobby_name]['started'] = False
-
-    if client.team_dict[player.lobby_name]['started']:
-        publish_error_to_lobby(client, player.lobby_name, "Game has already started, please make a new lobby")
 
-    add_team(client, player)
+# Sharded mode: lobbies are hashed to worker processes that own their Game objects, the MQTT client only routes
+# incoming messages to the shards and publishes what they send back
+class ShardClient():
+    def __init__(self, round_seconds=None, max_cells=MAX_BOARD_CELLS):
+        """
+        Stands in for the paho client inside a shard, the dispatched functions run on it unchanged
+        :param round_seconds: round length of lobbies that do not set one, None waits for every move
+        :param max_cells: largest board a lobby may ask for
+        """
+        init_lobby_state(self)
+        self.round_seconds = round_seconds
+        self.max_cells = max_cells
+        self.ticks = TickScheduler()
+        self.outbox = []
 
-    print(f'Added Player: {player.player_name} to Team: {player.team_name}')
+    def publish(self, topic, payload=None):
+        self.outbox.append((topic, payload))
 
 
-def add_team(client, player):
-    # If team not in lobby, make new team and start a player list for the team
-    if player.team_name not in client.team_dict[player.lobby_name].keys():
-        client.team_dict[player.lobby_name][player.team_name] = [player.player_name,]    
-    # If team already exists, add player to existing list
-    else:
-        client.team_dict[player.lobby_name][player.team_name].append(player.player_name)
+def shard_of(lobby_name: str, num_shards: int) -> int:
+    # crc32 rather than hash(), which is salted differently in every process
+    return zlib.crc32(lobby_name.encode()) % num_shards
 
-move_to_Moveset = {
-    'UP' : Moveset.UP,
-    'DOWN' : Moveset.DOWN,
-    'LEFT' : Moveset.LEFT,
-    'RIGHT' : Moveset.RIGHT
-}
 
-# Dispatched Function: handles player movement commands
-def player_move(client, topic_list, msg_payload):
-    lobby_name = topic_list[1]
-    player_name = topic_list[2]
-    if lobby_name in client.team_dict.keys():
+def run_shard(inbox, outbox, round_seconds=None, max_cells=MAX_BOARD_CELLS):
+    """
+        Worker process: handles (topic, payload) messages from inbox and the round deadlines of its lobbies until it
+        receives None
+        :param inbox: queue of messages for the lobbies of this shard
+        :param outbox: queue shared by all shards, receives the list of (topic, payload) publishes of each message
+    """
+    client = ShardClient(round_seconds, max_cells)
+    while True:
         try:
-            new_move = msg_payload.decode()
-
-            client.move_dict[lobby_name][player_name] = (player_name, move_to_Moveset[new_move])
-            game: Game = client.game_dict[lobby_name]
-
-            # If all players made a move, resolve movement
-            if len(game.all_players) == len(client.move_dict[lobby_name]):
-                for player, move in client.move_dict[lobby_name].values():
-                    game.movePlayer(player, move)
-
-                # Publish player states after all movement is resolved
-                for player, _ in client.move_dict[lobby_name].values():
-                    client.publish(f'games/{lobby_name}/{player}/game_state', json.dumps(game.getGameData(player)))
-
-                # Clear move list
-                client.move_dict[lobby_name].clear()
-                print(game.map)
-                client.publish(f'games/{lobby_name}/scores', json.dumps(game.getScores()))
-                if game.gameOver():
-                    # Publish game over, remove game
-                    publish_to_lobby(client, lobby_name, "Game Over: All coins have been collected")
-                    client.team_dict.pop(lobby_name)
-                    client.move_dict.pop(lobby_name)
-                    client.game_dict.pop(lobby_name)
-
-        except Exception as e:
-            raise e
-            publish_error_to_lobby(client, lobby_name, e.__str__)
-    else:
-        publish_error_to_lobby(client, lobby_name, "Lobby name not found.")
-
-
-# Dispatched function: Instantiates Game object
-def start_game(client, topic_list, msg_payload):
-    lobby_name = topic_list[1]
-    if isinstance(msg_payload, bytes) and msg_payload.decode() == "START":
-
-        if lobby_name in client.team_dict.keys():
-                # create new game
-                dict_copy = copy.deepcopy(client.team_dict[lobby_name])
-                dict_copy.pop('started')
+            messages = [inbox.get(timeout=client.ticks.timeUntilNext())]
+        except queue.Empty:
+            messages = []
+        if messages == [None]:
+            return
+        messages = [(f'games/{lobby_name}/tick', b'') for lobby_name in client.ticks.popDue()] + messages
+        for message in messages:
+            try:
+                handle_message(client, *message)
+            except Exception as e:
+                print(f"Error in shard handling {message[0]}: {e}")
+            if client.outbox:
+                outbox.put(client.outbox)
+                client.outbox = []
+
+
+def lobby_of(topic_list, msg_payload):
+    """
+        :return: lobby name a message belongs to, None if it cannot be routed
+    """
+    if topic_list[-1] == 'new_game':
+        try:
+            return NewPlayer(**json.loads(msg_payload)).lobby_name
+        except:
+            print("ValidationError in create_game")
+            return None
+    return topic_list[1] if len(topic_list) > 2 else None
 
-                game = Game(dict_copy)
-                client.game_dict[lobby_name] = game
-                client.move_dict[lobby_name] = OrderedDict()
-                client.team_dict[lobby_name]["started"] = True
 
-                for player in game.all_players.keys():
-                    client.publish(f'games/{lobby_name}/{player}/game_state', json.dumps(game.getGameData(player)))
+def on_message_sharded(client, userdata, msg):
+    """
+        Routes a message to the shard owning its lobby ( used as callback for subscribe in sharded mode )
+    """
+    topic_list = msg.topic.split("/")
+    if topic_list[-1] not in dispatch.keys():
+        return
+    lobby_name = lobby_of(topic_list, msg.payload)
+    if lobby_name is not None:
+        client.shard_inboxes[shard_of(lobby_name, len(client.shard_inboxes))].put((msg.topic, msg.payload))
 
 
-                print(game.map)
-    elif isinstance(msg_payload, bytes) and msg_payload.decode() == "STOP":
-        publish_to_lobby(client, lobby_name, "Game Over: Game has been stopped")
-        client.team_dict.pop(lobby_name, None)
-        client.move_dict.pop(lobby_name, None)
-        client.game_dict.pop(lobby_name, None)
+def forward_publishes(client, outbox):
+    for publishes in iter(outbox.get, None):
+        for topic, payload in publishes:
+            client.publish(topic, payload)
 
 
-def publish_error_to_lobby(client, lobby_name, error):
-    publish_to_lobby(client, lobby_name, f"Error: {error}")
+def start_shards(client, num_shards: int, round_seconds=None, max_cells=MAX_BOARD_CELLS):
+    """
+        Starts num_shards worker processes and the thread publishing their messages through client
+    """
+    client.shard_inboxes = [multiprocessing.Queue() for _ in range(num_shards)]
+    outbox = multiprocessing.Queue()
+    client.shards = [multiprocessing.Process(target=run_shard, args=(inbox, outbox, round_seconds, max_cells),
+                                           daemon=True)
+                     for inbox in client.shard_inboxes]
+    for shard in client.shards:
+        shard.start()
+    threading.Thread(target=forward_publishes, args=(client, outbox), daemon=True).start()
+    client.on_message = on_message_sharded
+
+
+# Pooled mode: the client gathers players and every started game moves to a GameInstanceManager on its own
+# connection, subscribed only to the topics of its lobby, so the broker rather than one callback splits the moves
+def on_message_pooled(client, userdata, msg):
+    """
+        Handles new players and starts games on pooled instances ( used as callback for subscribe in pooled mode )
+    """
+    print("message: " + msg.topic + " " + str(msg.qos) + " " + str(msg.payload))
+    topic_list = msg.topic.split("/")
+    with client.lobby_lock:
+        if topic_list[-1] == 'start':
+            start_instance(client, topic_list, msg.payload)
+        elif topic_list[-1] == 'new_game':
+            add_player(client, topic_list, msg.payload)
 
 
-def publish_to_lobby(client, lobby_name, msg):
-    client.publish(f"games/{lobby_name}/lobby", msg)
+def start_instance(client, topic_list, msg_payload):
+    lobby_name = topic_list[1]
+    if lobby_name in client.instances:
+        # The instance is subscribed to its start topic and handles STOP itself
+        return
+    start = parse_start(msg_payload)
+    if start is None or lobby_name not in client.team_dict.keys():
+        start_game(client, topic_list, msg_payload)
+        return
 
+    teams = {team: players for team, players in client.team_dict[lobby_name].items() if team != 'started'}
+    config = apply_start(client, lobby_name, start)
+    if board_too_big(client, lobby_name, config):
+        return
+    # Reuses the connection of a finished game when there is one
+    if client.idle_clients:
+        instance_client = client.idle_clients.pop()
+    else:
+        instance_client = client.connect_instance(f'GameInstance-{lobby_name}')
+        instance_client.loop_start()
+    instance = GameInstanceManger.GameInstanceManager(lobby_name, teams, instance_client, client.ticks,
+                                                      client.encoding_dict[lobby_name],
+                                                      client.delta_players.get(lobby_name, ()),
+                                                      client.round_seconds_dict[lobby_name], config, client.max_cells,
+                                                      on_finish=lambda instance: retire_instance(client, instance))
+    # Keeps the lobby marked as started so late players get an error
+    client.team_dict[lobby_name]['started'] = True
+    client.instances[lobby_name] = instance
+    instance.start()
+
+
+def retire_instance(client, instance):
+    """
+        Forgets the finished game of an instance and keeps its connection for the next game while the pool has room
+    """
+    with client.lobby_lock:
+        client.instances.pop(instance.lobby_name, None)
+        remove_lobby(client, instance.lobby_name)
+        if len(client.idle_clients) < client.pool_size:
+            client.idle_clients.append(instance.client)
+            return
+    instance.client.loop_stop()
+    instance.client.disconnect()
 
-dispatch = {
-    'new_game' : add_player,
-    'move' : player_move,
-    'start' : start_game,
-}
 
+def on_tick_pooled(client, lobby_name):
+    instance = client.instances.get(lobby_name)
+    if instance is not None:
+        instance.on_tick()
 
-if __name__ == '__main__':
-    load_dotenv(dotenv_path='./credentials.env')
-    
-    broker_address = os.environ.get('BROKER_ADDRESS')
-    broker_port = int(os.environ.get('BROKER_PORT'))
-    username = os.environ.get('USER_NAME')
-    password = os.environ.get('PASSWORD')
-
-    client = paho.Client(callback_api_version=paho.CallbackAPIVersion.VERSION1, client_id="GameClient", userdata=None, protocol=paho.MQTTv5)
-  
-    # enable TLS for secure connection
-    client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
-    # set username and password
-    client.username_pw_set(username, password)
-    # connect to HiveMQ Cloud on port 8883 (default for MQTT)
-    client.connect(broker_address, broker_port)
 
+def init_game_client(client, shards=0, round_seconds=None, pool_size=None, connect_instance=create_client,
+                     max_cells=MAX_BOARD_CELLS):
+    """
+        Sets up a connected client to serve games: callbacks, lobby state, round deadlines and subscriptions
+        :param shards: worker processes to spread lobbies over, 0 runs every lobby in this process
+        :param round_seconds: round length of lobbies that do not set one, None waits for every move
+        :param pool_size: host every started game on its own connection, keeping up to pool_size idle connections
+                          for later games, None handles every game on client
+        :param connect_instance: function making a connected client from a client id for the pooled instances
+        :param max_cells: largest board a lobby may ask for, bigger ones get an error instead of a game
+    """
+    if shards > 0 and pool_size is not None:
+        raise ValueError('shards and pool_size cannot be combined')
     # setting callbacks, use separate functions like above for better visibility
     client.on_subscribe = on_subscribe # Can comment out to not print when subscribing to new topics
     client.on_message = on_message
     client.on_publish = on_publish # Can comment out to not print when publishing to topics
     
     # custom dictionary to track players
-    client.team_dict = {} # Keeps tracks of players before a game starts {'lobby_name' : {'team_name' : [player_name, ...]}}
-    client.game_dict = {} # Keeps track of the games {{'lobby_name' : Game Object}
-    client.move_dict = {} # Keeps track of the games {{'lobby_name' : Game Object}
+    init_lobby_state(client) # Players, games and settings of every lobby, see lobbyHandlers.LOBBY_STATE
+    client.round_seconds = round_seconds
+    client.max_cells = max_cells
+    client.ticks = TickScheduler() # Round deadlines of all lobbies
+    client.lobby_lock = threading.RLock() # Reentrant as a pooled game can finish while it is being started
+
+    if shards > 0:
+        start_shards(client, shards, round_seconds, max_cells)
+    elif pool_size is not None:
+        client.instances = {} # Pooled instance of every started game {'lobby_name' : GameInstanceManager}
+        client.idle_clients = [] # Connections of finished games, reused by the next started games
+        client.pool_size = pool_size
+        client.connect_instance = connect_instance
+        client.on_message = on_message_pooled
+        threading.Thread(target=client.ticks.runForever, args=(lambda lobby_name: on_tick_pooled(client, lobby_name),), daemon=True).start()
+    else:
+        threading.Thread(target=client.ticks.runForever, args=(lambda lobby_name: on_tick(client, lobby_name),), daemon=True).start()
 
     client.subscribe("new_game")
     client.subscribe('games/+/start')
-    client.subscribe('games/+/+/move')
+    # Pooled instances subscribe to the moves and acks of their own lobby
+    if pool_size is None:
+        client.subscribe('games/+/+/move')
+        client.subscribe('games/+/+/ack')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=int, default=0, help='worker processes to spread lobbies over, 0 runs every lobby in this process')
+    parser.add_argument('--pool', type=int, default=None, metavar='SIZE', help='host every started game on its own connection subscribed to its lobby only, keeping up to SIZE idle connections for reuse')
+    parser.add_argument('--round-seconds', type=float, default=None, help='round length of lobbies that do not set one, by default rounds wait for every move')
+    parser.add_argument('--max-cells', type=int, default=MAX_BOARD_CELLS, help='largest board, width * height, a lobby may ask for')
+    args = parser.parse_args()
+
+    # connects to the broker of credentials.env, or the in-memory one with MQTT_TRANSPORT=local
+    client = create_client("GameClient")
+    init_game_client(client, args.shards, args.round_seconds, args.pool, max_cells=args.max_cells)
     
     client.loop_forever()
@@ -1,64 +1,107 @@
-import os
-import json
+import threading
 
-import paho.mqtt.client as paho
-from paho import mqtt
-from dotenv import load_dotenv
-from pydantic import ValidationError
+import lobbyHandlers
+from InputTypes import LobbyConfig
+from tickScheduler import TickScheduler
+from transport import create_client
 
-from InputTypes import NewPlayer, Move
-from game import Game
 
+class GameInstanceManager():
+    def __init__(self, lobby_name: str, team_dict: dict[str,list[str]], client=None, ticks=None, encoding='json',
+                 delta_players=(), round_seconds=None, config=None, max_cells=lobbyHandlers.MAX_BOARD_CELLS,
+                 on_finish=None):
+        """
+        Hosts the game of one lobby on its own client, subscribed only to the topics of that lobby, so the broker
+        delivers each lobby's moves to its own host. The handlers of lobbyHandlers run on this object
+        :param team_dict: {'team_name' : [player_name, ...]}
+        :param client: connected client with a running loop to host on, a new one is made and started when None
+        :param ticks: TickScheduler calling on_tick with lobby_name at the round deadlines, one is made when None
+        :param encoding: message encoding of the lobby, json or binary
+        :param delta_players: players that asked for delta game states
+        :param round_seconds: round length, None waits for every move
+        :param config: LobbyConfig board settings, the defaults when None
+        :param max_cells: largest board the lobby may ask for
+        :param on_finish: called with this instance instead of disconnecting the client once the game is over
+        """
+        self.lobby_name = lobby_name
+        lobbyHandlers.init_lobby_state(self)
+        self.team_dict[lobby_name] = {'started': False, **team_dict}
+        self.delta_players[lobby_name] = set(delta_players)
+        self.encoding_dict[lobby_name] = encoding
+        self.round_seconds_dict[lobby_name] = round_seconds
+        self.config_dict[lobby_name] = config or LobbyConfig()
+        self.round_seconds = round_seconds
+        self.max_cells = max_cells
+        self.on_finish = on_finish
+        self.finished = False
+        self.lock = threading.Lock()
 
-# Global Variables
-load_dotenv(dotenv_path='./credentials.env')
+        # initialize and connect a new client
+        self.owns_client = client is None
+        self.client = create_client(lobby_name) if client is None else client
+        self.ticks = ticks
+        self.stop_ticks = None
+        if ticks is None:
+            self.ticks = TickScheduler()
+            self.stop_ticks = threading.Event()
+            threading.Thread(target=self.ticks.runForever, args=(lambda key: self.on_tick(), self.stop_ticks),
+                             daemon=True).start()
 
-broker_address = os.environ.get('BROKER_ADDRESS')
-broker_port = int(os.environ.get('BROKER_PORT'))
-username = os.environ.get('USERNAME')
-password = os.environ.get('PASSWORD')
+        # player movement, delta acks and STOP of this lobby only
+        self.topics = [f"games/{lobby_name}/start"]
+        for team in team_dict.keys():
+            for player in team_dict[team]:
+                self.topics.append(f"games/{lobby_name}/{player}/move")
+                self.topics.append(f"games/{lobby_name}/{player}/ack")
 
+    def publish(self, topic, payload=None):
+        return self.client.publish(topic, payload)
 
-def on_message(self, client, userdata, msg):
+    def on_message(self, client, userdata, msg):
         """
-        Prints a mqtt message to stdout ( used as callback for subscribe )
-        :param client: the client itself
-        :param userdata: userdata is set when initiating the client, here it is userdata=None
-        :param msg: the message with topic and payload
+        Handles a message of this lobby ( used as callback for subscribe )
         """
-        pass
+        # A reused client may still receive messages of the lobby it hosted before
+        if msg.topic.split("/")[1] == self.lobby_name:
+            self.handle(msg.topic, msg.payload)
 
-
-class GameInstanceManager():
-    def __init__(self, lobby_name: str, team_dict: dict[str,list[str]]):
+    def on_tick(self):
         """
-        Creates a new client to handle each game
+        Resolves the round once its deadline passed ( used as callback for TickScheduler.runForever )
         """
-        # initialize new client
-        self.client = paho.Client(callback_api_version=paho.CallbackAPIVersion.VERSION1, client_id=lobby_name, userdata=None, protocol=paho.MQTTv5)
-        # enable TLS for secure connection
-        self.client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
-        # set username and password
-        self.client.username_pw_set(username, password)
-        # connect to HiveMQ Cloud on port 8883 (default for MQTT)
-        self.client.connect(broker_address, broker_port)
-        # handles subscription
-        self.client.on_message = self.on_message
+        self.handle(f'games/{self.lobby_name}/tick', b'')
 
-        # subscribes to player movement topics
-        for team in team_dict.keys():
-             for player in team_dict[team]:  
-                self.client.subscribe(f"games/{lobby_name}/{player}/move")
+    def handle(self, topic, payload):
+        with self.lock:
+            if self.finished:
+                return
+            lobbyHandlers.handle_message(self, topic, payload)
+            # remove_lobby dropped the game, it is over or was stopped
+            self.finished = self.lobby_name not in self.team_dict
+        if self.finished:
+            self.close()
 
     def start(self):
-        self.client.loop_start()
-
-    def __del__(self):
-        self.client.loop_stop()
-        self.client.disconnect()
-
-
-    
+        """
+        Subscribes to the topics of the lobby and starts its game
+        """
+        self.client.on_message = self.on_message
+        for topic in self.topics:
+            self.client.subscribe(topic)
+        if self.owns_client:
+            self.client.loop_start()
+        self.handle(f'games/{self.lobby_name}/start', b'START')
 
-if __name__ == "__main__":
-    game = GameInstanceManager()
+    def close(self):
+        """
+        Stops listening to the lobby, then hands the client to on_finish or disconnects it
+        """
+        for topic in self.topics:
+            self.client.unsubscribe(topic)
+        if self.stop_ticks is not None:
+            self.stop_ticks.set()
+        if self.on_finish is not None:
+            self.on_finish(self)
+        elif self.owns_client:
+            self.client.loop_stop()
+            self.client.disconnect()
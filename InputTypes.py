@@ -1,12 +1,33 @@
-from pydantic import BaseModel, constr
+from typing import Optional
 
-class NewPlayer(BaseModel):
+from pydantic import BaseModel, constr, confloat, conint
+
+# Board settings of a lobby, coordinates and the vision radius have to fit the binary formats, see wireFormat
+class LobbyConfig(BaseModel):
+    width: conint(ge=1, le=0xFFFF) = 10
+    height: conint(ge=1, le=0xFFFF) = 10
+    wall_density: Optional[confloat(ge=0, le=1)] = None # fraction of the board covered by walls, random when None
+    vision_radius: conint(ge=1, le=0xFF) = 2 # at least 1, the bots read the neighbouring cells
+    spectate: bool = False # publish board frames on games/{lobby_name}/board, see GameClient.publish_board
+
+class NewPlayer(LobbyConfig):
     lobby_name: constr(min_length=1, max_length=20)
     team_name: constr(min_length=1, max_length=20)
     player_name: constr(min_length=1, max_length=20)
+    delta: bool = False # receive game_state as deltas, see stateDelta
+    encoding: constr(pattern=r'^(json|binary)$') = 'json' # message encoding of a new lobby, see wireFormat
+    round_seconds: Optional[confloat(gt=0)] = None # round length of a new lobby, missing moves are skipped
+    # width, height, wall_density and vision_radius of LobbyConfig set up a new lobby, spectate turns on the board
+    # frames of any lobby
 
 class Move(BaseModel):
     move: constr(pattern=r'^(UP|DOWN|LEFT|RIGHT)$')
 
 class Start(BaseModel):
     start: constr(pattern=r'^(START)$')
+    # Replaces the settings the lobby was created with, for the ones given
+    width: Optional[conint(ge=1, le=0xFFFF)] = None
+    height: Optional[conint(ge=1, le=0xFFFF)] = None
+    wall_density: Optional[confloat(ge=0, le=1)] = None
+    vision_radius: Optional[conint(ge=1, le=0xFF)] = None
+    spectate: Optional[bool] = None
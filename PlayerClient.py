@@ -1,12 +1,16 @@
-import os
 import json
-from dotenv import load_dotenv
 
 import random
-import paho.mqtt.client as paho
-from paho import mqtt
+import threading
 import time
 
+from moveset import Moveset
+from bots import PlannerBot
+from viewport import Viewport
+from stateDelta import DeltaDecoder
+from wireFormat import decodeGameData, decodeScores, decodeBoard, decodeBoardDelta, applyBoardDelta, BOARD, encodeMove
+from transport import create_client
+
 # Dictionary unique to each client used to track game variables
 game_vars = {
   'players' : {}, 
@@ -20,7 +24,16 @@ game_vars = {
   'client_id' : None,
   'client_states' : {},
   'game_over' : False, 
-  'active_room' : None
+  'active_room' : None,
+  'delta' : True, # asks the GameClient for delta encoded game states
+  'encoding' : 'json', # json or binary, used for the lobby if this client creates it, see wireFormat
+  'decoders' : {},
+  'spectator' : False,
+  'board' : None, # last board frame of a spectator, see wireFormat.decodeBoard
+  'vision_radius' : 2, # game_state window radius and board size the player maps are drawn for, see viewport
+  'board_size' : (10, 10), # (height, width), sent with the vision radius when this client creates the lobby
+  'wall_density' : None, # fraction of the board covered by walls in a lobby this client creates, random when None
+  'state_changed' : threading.Condition() # notified by on_message after every update, see wait_until
   }
 
 # setting callbacks for different events to see if it works, print the message etc.
@@ -77,11 +90,36 @@ def on_message(client, userdata, msg):
     if msg.topic.endswith('game_state'): # update player info
       (_, lobby, player, _) = msg.topic.split('/')
       if player in players.keys():
-        players[player]['game_data'] = json.loads(msg.payload)
-        update_player_pos(player, json.loads(msg.payload))
+        game_data = json.loads(msg.payload) if msg.payload[:1] == b'{' else decodeGameData(msg.payload)
+        if 'seq' in game_data: # delta encoded, see stateDelta
+          seq = game_data['seq']
+          game_data = game_vars['decoders'].setdefault(player, DeltaDecoder()).apply(game_data)
+          if game_data is None: # missed the state this delta builds on, wait for the next keyframe
+            return
+          client.publish(f"games/{lobby}/{player}/ack", seq)
+        players[player]['game_data'] = game_data
+        update_player_pos(player, game_data)
     
+    elif msg.topic.endswith('config'): # board settings of the game, published when it starts
+      config = json.loads(msg.payload)
+      game_vars['board_size'] = (config['height'], config['width'])
+      game_vars['vision_radius'] = config['vision_radius']
+      for player_vars in players.values():
+        player_vars.pop('viewport', None) # remade for the new board by update_player_pos
+        if player_vars.get('planner') is not None:
+          player_vars['planner'] = PlannerBot(config['height'], config['width'], visionRadius=config['vision_radius'])
+
+    elif msg.topic.endswith('board'): # board frame, only subscribed to by spectators
+      if msg.payload[0] == BOARD: # whole board
+        game_vars['board'] = decodeBoard(msg.payload)
+      elif game_vars['board'] is None or not applyBoardDelta(game_vars['board'], decodeBoardDelta(msg.payload)):
+        game_vars['board'] = None # missed a frame, wait for the next whole board
+        return
+      game_vars['scores'] = game_vars['board']['scores']
+      show_board(game_vars['board'])
+
     elif msg.topic.endswith('scores'): # updated local scores
-      game_vars['scores'] = json.loads(msg.payload)
+      game_vars['scores'] = json.loads(msg.payload) if msg.payload[:1] == b'{' else decodeScores(msg.payload)
     
     elif msg.topic.endswith('chat'): # updates chat
       (_, _, team, _) = msg.topic.split('/')
@@ -109,6 +147,19 @@ def on_message(client, userdata, msg):
     elif msg.payload.decode().startswith('Game Over'): # updates whether game is over
       game_vars['game_over'] = True
 
+    # Wakes up the main thread if it is waiting for what this message changed
+    with game_vars['state_changed']:
+      game_vars['state_changed'].notify_all()
+
+
+def wait_until(predicate, timeout=None) -> bool:
+  """
+  Blocks until predicate() is true, checking it whenever on_message has handled a message
+  Returns the last value of predicate(), which is only false if timeout seconds passed first
+  """
+  with game_vars['state_changed']:
+    return game_vars['state_changed'].wait_for(predicate, timeout)
+
 def display_teams():
   """
   Displays the teams and their respective players
@@ -119,82 +170,46 @@ def display_teams():
   print()
     
 def update_player_pos(player, game_data):
-  marker = { # used to map items in game data to visual represenations
-    'free'  : '__',
-    'walls' : '[]',
-    'oob' : 'XX',
-    'coin1' : '$1',
-    'coin2' : '$2',
-    'coin3' : '$3',
-    'enemyPositions' : 'ENMY'
-  }
-  #print(str(player) + "|" + str(game_data))
-  top_left =  [i-2 for i in game_data['currentPosition']]
-  
-  game_map = [[None for i in range(0,5)] for i in range(0,5)] # Builds a 5x5 2-D list representing game map
-  for i in range(0,5):
-    for j in range(0,5):
-      if top_left[0] + i in range(0,10) and top_left[1] + j in range(0,10):
-        game_map[i][j] = marker['free']
-      else:
-        game_map[i][j] = marker['oob']
-  
-  def update_map(loc : list[2], entity : str):
-    """
-    Updates coordinate loc to match its corresponding graphic in marker
-    If no graphic is found, sets the graphic to be the capitalized entity
-    """
-    game_map[loc[0] - top_left[0]][loc[1] - top_left[1]] = marker[entity] if entity in marker.keys() else entity.capitalize()
-
-  for entity, locs in dict.items(game_data): # handles drawing teammates and the active player's current position on the map
-    if entity == 'teammateNames':
-      continue
-    elif entity == 'teammatePositions':
-      for i in range(0, len(locs)):
-        update_map(locs[i], game_data['teammateNames'][i])
-    elif entity == 'currentPosition':
-      update_map(locs, player)
-    else:  
-      for loc in locs:
-        update_map(loc, entity)
-        
-  game_vars['players'][player]['map'] = game_map 
-  game_vars['players'][player]['map_updated'] = True
+  """
+  Draws the game data into the player's persistent viewport, refilling its rows in place
+  """
+  player_vars = game_vars['players'][player]
+  if 'viewport' not in player_vars:
+    player_vars['viewport'] = Viewport(game_vars['vision_radius'], *game_vars['board_size'])
+  player_vars['viewport'].update(player, game_data)
+  player_vars['map'] = player_vars['viewport'].cells # rows of cell graphics centered on the player
+  player_vars['map_updated'] = True
 
 def show_map(player):
   """
   Prints out the map for a given player
   """
-  print(f"\n{player}'s map:")
-  for row in game_vars['players'][player]['map']:
-      print('\t'.join(row))
+  game_vars['players'][player]['viewport'].render(f"\n{player}'s map:")
       
       
+def show_board(board):
+  """
+  Prints out the whole board of a board frame along with the scores, for spectators
+  """
+  marker = ['__', '[]', '$1', '$2', '$3'] + board['players'] # used to map cell codes to visual representations
+  print(f"\nBOARD:")
+  for row in board['codes'].tolist():
+    print('\t'.join(marker[code] for code in row))
+  show_scoreboard()
+
+
 def init_client():
   """
   Initiliazes MQTT client and updates game_vars['client'] to contain the MQTT client
   """
   
-  load_dotenv(dotenv_path='./credentials.env')
-
-  broker_address = os.environ.get('BROKER_ADDRESS')
-  broker_port = int(os.environ.get('BROKER_PORT'))
-  username = os.environ.get('USER_NAME')
-  password = os.environ.get('PASSWORD')
-  
   # Generates random id for each client
   random.seed(time.time_ns())
   client_id = str(random.randint(0, 100000))
   game_vars['client_id'] = client_id
 
-  client = paho.Client(callback_api_version=paho.CallbackAPIVersion.VERSION1, client_id="", userdata=None, protocol=paho.MQTTv5)
-  
-  # enable TLS for secure connection
-  client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
-  # set username and password
-  client.username_pw_set(username, password)
-  # connect to HiveMQ Cloud on port 8883 (default for MQTT)
-  client.connect(broker_address, broker_port)
+  # connects to the broker of credentials.env, or the in-memory one with MQTT_TRANSPORT=local
+  client = create_client()
 
   # setting callbacks, use separate functions like above for better visibility
   client.on_subscribe = on_subscribe
@@ -207,6 +222,7 @@ def init_client():
   client.subscribe(f"games/{lobby_name}/lobby")
   client.subscribe(f'games/{lobby_name}/+/game_state')
   client.subscribe(f'games/{lobby_name}/scores')
+  client.subscribe(f'games/{lobby_name}/config')
   client.subscribe(f'games/{lobby_name}/current_player')
   client.subscribe(f'games/{lobby_name}/teams')
   client.subscribe(f'games/{lobby_name}/client_states')
@@ -238,26 +254,30 @@ def matchmaking():
 
     display_teams()
     
-    choice = input(f"Please select one of the following\n[U] Create User\n[B] Create Bot \n[S] Start Game\n")
+    choice = input(f"Please select one of the following\n[U] Create User\n[B] Create Bot \n[S] Start Game\n[W] Watch Game\n")
     
     if choice == "U":
       create_user()
       
     elif choice == "B":
       team = input(f"\nWhat team should the bot Player{sum([len(team) for team in game_vars['teams'].values()]) + 1} be on?\n")
-      mode = input(f"\nWhat mode should this bot be? n/a or algorithm :")
+      mode = input(f"\nWhat mode should this bot be? n/a, algorithm or planner :")
       create_bot(team, mode)
       
     elif choice == "S":
       update_client_state(game_vars['client_id'], 'ready')
       print(f'\nWaiting for all clients to ready up!')
       
-      while not all_synced('ready'): # Waits for all clients before exiting matchmaking
-        update_client_state(game_vars['client_id'], 'ready')
-        time.sleep(5)
+      while not wait_until(lambda: all_synced('ready', 'spectating'), 5): # Waits for all clients before exiting matchmaking
         print(game_vars['client_states'])
       return
 
+    elif choice == "W":
+      # Spectators count as ready so they never hold up the start of the game, and get the lobby's board frames
+      update_client_state(game_vars['client_id'], 'spectating')
+      game_vars['spectator'] = True
+      return
+
 def update_teams():
   """
   Updates the list of current teams and players
@@ -300,13 +320,26 @@ def set_current_player(player):
   game_vars['currentPlayer'] = player
   game_vars['client'].publish(f"games/{game_vars['lobby_name']}/current_player", player)
 
+def spectate():
+  """
+  Watches the game through the lobby's board frames until it is over, without controlling any players
+  """
+  game_vars['client'].subscribe(f"games/{game_vars['lobby_name']}/board")
+  print(f"\nWatching lobby {game_vars['lobby_name']}")
+  wait_until(lambda: game_vars['game_over'])
+
+
 def start_game():
   """
   Sets player order, then starts a game
   """
   set_order()
   time.sleep(1) # Wait a second to resolve game start
-  game_vars['client'].publish(f"games/{game_vars['lobby_name']}/start", "START")
+  # The board frames are only published when a client watches
+  if 'spectating' in game_vars['client_states'].values():
+    game_vars['client'].publish(f"games/{game_vars['lobby_name']}/start", json.dumps({'start' : 'START', 'spectate' : True}))
+  else:
+    game_vars['client'].publish(f"games/{game_vars['lobby_name']}/start", "START")
   print(f"\n\nGAME STARTED!")
 
   
@@ -383,14 +416,30 @@ def create_user() -> str:
     'team' : team,
     'chat' : list(),
     }
-  game_vars['client'].publish("new_game", json.dumps({'lobby_name':game_vars['lobby_name'],
-                                        'team_name': team,
-                                        'player_name' : name}))
+  publish_new_player(team, name)
   print("player published")
   update_teams()
   return name
 
 
+def publish_new_player(team, name):
+  """
+  Joins a player to the lobby, the settings of this client set up the lobby if it is new
+  """
+  height, width = game_vars['board_size']
+  new_player = {'lobby_name' : game_vars['lobby_name'],
+                'team_name' : team,
+                'player_name' : name,
+                'delta' : game_vars['delta'],
+                'encoding' : game_vars['encoding'],
+                'width' : width,
+                'height' : height,
+                'vision_radius' : game_vars['vision_radius']}
+  if game_vars['wall_density'] is not None:
+    new_player['wall_density'] = game_vars['wall_density']
+  game_vars['client'].publish("new_game", json.dumps(new_player))
+
+
 def create_bot(team, mode) -> str:
   """
   Creates a new bot to be added as a player to the game
@@ -398,22 +447,20 @@ def create_bot(team, mode) -> str:
   Returns the name of the new bot
   """
   players = game_vars['players']
-  client = game_vars['client']
-  lobby_name = game_vars['lobby_name']
   
   name = f"Player{len(players) + 1}"
   players[name] = {
     'type' : 'bot',
     'map_updated' : False,
     'team' : team,
-    'mode' : mode, #n/a or algorithm
+    'mode' : mode, #n/a, algorithm or planner
+    # remembers the board the bot has seen, see bots.PlannerBot
+    'planner' : PlannerBot(*game_vars['board_size'], visionRadius=game_vars['vision_radius']) if mode == 'planner' else None,
     'scale_up': True,
     'scale_right': True,
     'face': 0
   }
-  client.publish("new_game", json.dumps({'lobby_name':lobby_name,
-                                        'team_name': team,
-                                        'player_name' : name}))
+  publish_new_player(team, name)
   update_teams()
   
   return name
@@ -455,8 +502,9 @@ def user_move(name):
   players = game_vars['players']
   
   # Waits until a player's map is updated to show their new map
-  while not players[name]['map_updated']: 
-    pass
+  wait_until(lambda: game_vars['players'][name]['map_updated'] or game_vars['game_over'])
+  if game_vars['game_over']:
+    return
   show_map(name)
   players[name]['map_updated'] = False
 
@@ -474,18 +522,25 @@ def user_move(name):
       print(f"Uh-oh! {move} is an invalid move. Please enter a valid one!")
   
   # After player has selected a valid move, send it to the GameClient  
-  game_vars['client'].publish(f"games/{game_vars['lobby_name']}/{name}/move", move)
+  publish_move(name, move)
+
+
+def publish_move(name, move):
+  """
+  Sends a move name to the GameClient, as a single byte when this client uses the binary encoding
+  """
+  payload = encodeMove(Moveset[move]) if game_vars['encoding'] == 'binary' else move
+  game_vars['client'].publish(f"games/{game_vars['lobby_name']}/{name}/move", payload)
 
 
 # Allow a bot to make a move
 def bot_move(name): 
   #print("bot: " + name)
-  client = game_vars['client']
   players = game_vars['players']
-  lobby_name = game_vars['lobby_name']
   
-  while not players[name]['map_updated']:
-    pass
+  wait_until(lambda: game_vars['players'][name]['map_updated'] or game_vars['game_over'])
+  if game_vars['game_over']:
+    return
   
   match players[name]["mode"]:
     case 'algorithm':
@@ -497,10 +552,11 @@ def bot_move(name):
           block.append(player_name)
       print(block)
         
-      top = players[name]["map"][1][2]
-      bottom = players[name]["map"][3][2]
-      right = players[name]["map"][2][3]
-      left = players[name]["map"][2][1]
+      center = players[name]["viewport"].visionRadius
+      top = players[name]["map"][center - 1][center]
+      bottom = players[name]["map"][center + 1][center]
+      right = players[name]["map"][center][center + 1]
+      left = players[name]["map"][center][center - 1]
       
       # nearby = [top,bottom,right,left]
       # direction = ["UP","DOWN","RIGHT","LEFT"]; 
@@ -534,11 +590,17 @@ def bot_move(name):
       show_map(name)
       print(name + " | " + move + " | " + str(players[name]["scale_up"]) + " | " + str(players[name]["scale_right"]))
       #input()
-      client.publish(f"games/{lobby_name}/{name}/move", move)
+      publish_move(name, move)
+      players[name]['map_updated'] = False
+    case 'planner':
+      move = players[name]['planner'].move(players[name]['game_data']).name
+      show_map(name)
+      print(name + " | " + move)
+      publish_move(name, move)
       players[name]['map_updated'] = False
     case _:
       move = 'DOWN'
-      client.publish(f"games/{lobby_name}/{name}/move", move)
+      publish_move(name, move)
       players[name]['map_updated'] = False
   
   
@@ -576,12 +638,12 @@ def update_client_state(client_id, state):
       game_vars['client'].publish(f"games/{game_vars['lobby_name']}/client_states", json.dumps({client : state}))
 
 
-def all_synced(state) -> bool:
+def all_synced(*states) -> bool:
   """
-  Returns whether all clients's state is equal to the given state
+  Returns whether all clients's state is one of the given states
   """
   
-  synced = all([client_state == state for client_state in game_vars['client_states'].values()])
+  synced = all([client_state in states for client_state in game_vars['client_states'].values()])
   return synced
 
 def end_game():
@@ -633,9 +695,12 @@ if __name__ == '__main__':
   game_vars['client'].loop_start()
   title_screen()
   matchmaking()    
-  start_game()
-  while not game_vars['game_over']:
-    run_game()
+  if game_vars['spectator']:
+    spectate()
+  else:
+    start_game()
+    while not game_vars['game_over']:
+      run_game()
   end_game()
   game_vars['client'].loop_stop()
   
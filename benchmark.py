@@ -0,0 +1,509 @@
+"""
+Benchmarks for the game engine
+Usage: python benchmark.py [benchmark ...]   (runs every benchmark when none are given)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import tracemalloc
+import contextlib
+from copy import deepcopy
+
+import numpy as np
+
+from bots import AlgorithmBot
+from distanceField import DistanceField
+from game import Game
+from map import Map, getDefaultWallChoices
+from moveset import Moveset
+from player import Player
+from gameItems import *
+from stateDelta import DeltaEncoder, DeltaDecoder
+from wireFormat import encodeGameData, decodeGameData, encodeBoard, decodeBoard, encodeBoardDelta
+from transport import create_client
+from viewport import Viewport, MARKERS
+from simulation import runGames
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def timeit(func, repeat: int = 1) -> float:
+    """
+    :return: best wall time of func over repeat runs in seconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def allocated(func) -> tuple[object, int]:
+    """
+    :return: result of func and the bytes it left allocated
+    """
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+class LegacyItem:
+    """
+    Wall or coin before the flyweights, a plain object per cell
+    """
+
+
+class LegacyCoin1(LegacyItem):
+    @property
+    def value(self):
+        return 1
+
+
+def legacyLayout(m: Map) -> list[list[object]]:
+    """
+    Rebuilds the board of m in the old list-of-lists layout with one object per cell
+    """
+    return [[LegacyItem() if isinstance(cell, (Wall, Coin)) else cell for cell in row] for row in m.map]
+
+
+def legacyFillMap(height: int, width: int, players: list[Player], wallChoices: list[tuple[int, int]]):
+    """
+    The original Map.__fillMap: rejection sampling with the random module on a list-of-lists board
+    """
+    board = [[None for _ in range(width)] for _ in range(height)]
+
+    def placeRandom(obj, choice=None):
+        while True:
+            if choice is None:
+                x, y = random.randint(0, height - 1), random.randint(0, width - 1)
+            else:
+                x, y = random.choice(choice)
+                choice.remove((x, y))
+            if board[x][y] is None:
+                board[x][y] = obj
+                return x, y
+
+    empty = width * height
+    maxWalls = len(wallChoices)
+    minWalls = int(Map.WALL_MIN_RATIO * empty)
+    minWalls = 0 if maxWalls < minWalls else minWalls
+    numWalls = random.randint(minWalls, maxWalls)
+    choices = list(wallChoices)
+    for _ in range(numWalls):
+        placeRandom(Wall(), choices)
+    for player in players:
+        player.loc = placeRandom(player)
+    empty = empty - numWalls - len(players)
+    for _ in range(random.randint(int(Map.COIN_MIN_RATIO * empty), int(Map.COIN_MAX_RATIO * empty))):
+        placeRandom(random.choices((Coin1, Coin2, Coin3), (6, 3, 1))[0]())
+    return board
+
+
+def legacyViewport(playerName: str, gameData: dict, visionRadius: int, height: int, width: int) -> str:
+    """
+    The original PlayerClient.update_player_pos and show_map: a new window of graphics per game state, every row
+    joined for printing
+    """
+    side = 2 * visionRadius + 1
+    top, left = gameData['currentPosition'][0] - visionRadius, gameData['currentPosition'][1] - visionRadius
+    window = [[MARKERS['free'] if 0 <= top + i < height and 0 <= left + j < width else MARKERS['oob']
+               for j in range(side)] for i in range(side)]
+    for key, locs in gameData.items():
+        if key == 'teammateNames':
+            continue
+        elif key == 'teammatePositions':
+            for name, loc in zip(gameData['teammateNames'], locs):
+                window[loc[0] - top][loc[1] - left] = name.capitalize()
+        elif key == 'currentPosition':
+            window[locs[0] - top][locs[1] - left] = playerName.capitalize()
+        else:
+            for loc in locs:
+                window[loc[0] - top][loc[1] - left] = MARKERS[key]
+    return '\n'.join('\t'.join(row) for row in window)
+
+
+@benchmark
+def mapStorage():
+    print(f"{'board':>10} {'legacy MB':>10} {'grid MB':>10} {'legacy get/s':>14} {'grid get/s':>14} {'grid code/s':>14}")
+    for size in (10, 100, 500):
+        random.seed(0)
+        players = [Player(f'Player{i}', None) for i in range(4)]
+        m = Map(size, size, players, seed=0)
+        board, legacyBytes = allocated(lambda: legacyLayout(m))
+        _, gridBytes = allocated(lambda: Map(size, size, [Player(f'Player{i}', None) for i in range(4)], seed=0))
+
+        locs = [(random.randrange(size), random.randrange(size)) for _ in range(100000)]
+        legacyTime = timeit(lambda: [board[x][y] for x, y in locs], 3)
+        gridTime = timeit(lambda: [m.get(loc) for loc in locs], 3)
+        codeTime = timeit(lambda: [m.code(loc) for loc in locs], 3)
+        print(f"{f'{size}x{size}':>10} {legacyBytes / 2**20:>10.2f} {gridBytes / 2**20:>10.2f} "
+              f"{len(locs) / legacyTime:>14,.0f} {len(locs) / gridTime:>14,.0f} {len(locs) / codeTime:>14,.0f}")
+
+
+@benchmark
+def visionWindow():
+    g = Game({'TeamA': [f'A{i}' for i in range(10)], 'TeamB': [f'B{i}' for i in range(10)]}, 300, 300, seed=0)
+    threshold = Game.VECTORIZE_MIN_CELLS
+    print(f"{'radius':>6} {'python us':>10} {'numpy us':>10}")
+    for radius in (2, 5, 10, 20, 50):
+        times = []
+        for minCells in (float('inf'), 0):
+            Game.VECTORIZE_MIN_CELLS = minCells
+            times.append(timeit(lambda: [g.getGameData(name, radius) for name in g.all_players], 5) / len(g.all_players))
+        print(f"{radius:>6} {times[0] * 1e6:>10.1f} {times[1] * 1e6:>10.1f}")
+    Game.VECTORIZE_MIN_CELLS = threshold
+
+
+@benchmark
+def lobbyGameData():
+    print(f"{'players':>7} {'board':>8} {'radius':>6} {'per player ms':>14} {'batched ms':>11}")
+    for numPlayers, size in ((2, 10), (20, 40), (200, 120)):
+        g = Game({'TeamA': [f'A{i}' for i in range(numPlayers // 2)],
+                  'TeamB': [f'B{i}' for i in range(numPlayers - numPlayers // 2)]}, size, size, seed=0)
+        for radius in (2, 5):
+            perPlayer = timeit(lambda: {name: g.getGameData(name, radius) for name in g.all_players}, 20)
+            batched = timeit(lambda: g.getAllGameData(radius), 20)
+            print(f"{numPlayers:>7} {f'{size}x{size}':>8} {radius:>6} {perPlayer * 1e3:>14.3f} {batched * 1e3:>11.3f}")
+
+
+@benchmark
+def spatialQueries():
+    print(f"{'board':>10} {'radius':>6} {'window scan us':>15} {'coinsInRect us':>15} {'nearest scan us':>16} {'nearestCoin us':>15}")
+    for size in (100, 500):
+        random.seed(0)
+        m = Map(size, size, [Player(f'Player{i}', None) for i in range(4)], seed=0)
+        locs = [(random.randrange(size), random.randrange(size)) for _ in range(200)]
+
+        def nearestScan(loc):
+            coins = np.argwhere((m.window(0, size - 1, 0, size - 1) >= COIN1) & (m.window(0, size - 1, 0, size - 1) <= COIN3))
+            return coins[np.abs(coins - loc).sum(axis=1).argmin()]
+
+        nearestTime = timeit(lambda: [nearestScan(loc) for loc in locs], 3) / len(locs)
+        indexTime = timeit(lambda: [m.nearestCoin(loc) for loc in locs], 3) / len(locs)
+        for radius in (2, 10, 50):
+            rects = [(max(x - radius, 0), min(x + radius, size - 1), max(y - radius, 0), min(y + radius, size - 1))
+                     for x, y in locs]
+            scanTime = timeit(lambda: [np.argwhere((m.window(*rect) >= COIN1) & (m.window(*rect) <= COIN3)).tolist()
+                                       for rect in rects], 3) / len(rects)
+            rectTime = timeit(lambda: [m.coinsInRect(*rect) for rect in rects], 3) / len(rects)
+            print(f"{f'{size}x{size}':>10} {radius:>6} {scanTime * 1e6:>15.1f} {rectTime * 1e6:>15.1f} "
+                  f"{nearestTime * 1e6:>16.1f} {indexTime * 1e6:>15.1f}")
+
+
+@benchmark
+def mapGeneration():
+    # Default walls only cover a 10x10 corner, scaled walls make every odd cell a candidate and are skipped for the
+    # legacy generator past 500x500 where its O(n) list removals take minutes
+    print(f"{'board':>10} {'legacy s':>10} {'sampled s':>10} {'legacy scaled s':>16} {'sampled scaled s':>17}")
+    for size in (10, 100, 500, 1000, 2000):
+        players = lambda: [Player(f'Player{i}', None) for i in range(4)]
+        scaledWalls = [(x, y) for x in range(size) for y in range(size) if x % 2 and y % 2]
+        repeat = 5 if size <= 100 else 1
+        random.seed(0)
+        legacy = timeit(lambda: legacyFillMap(size, size, players(), getDefaultWallChoices()), repeat)
+        sampled = timeit(lambda: Map(size, size, players(), seed=0), repeat)
+        legacyScaled = timeit(lambda: legacyFillMap(size, size, players(), scaledWalls), repeat) if size <= 500 else None
+        sampledScaled = timeit(lambda: Map(size, size, players(), scaledWalls, seed=0), repeat)
+        print(f"{f'{size}x{size}':>10} {legacy:>10.4f} {sampled:>10.4f} "
+              f"{'-' if legacyScaled is None else f'{legacyScaled:.4f}':>16} {sampledScaled:>17.4f}")
+
+
+@benchmark
+def boardSnapshot():
+    # One observer read per tick followed by the round's writes
+    print(f"{'board':>10} {'deepcopy ms':>12} {'snapshot ms':>12}")
+    for size in (10, 100, 500):
+        g = Game({'TeamA': ['A0', 'A1'], 'TeamB': ['B0', 'B1']}, size, size, seed=0)
+        board = legacyLayout(g.map)
+
+        def tick(read):
+            read()
+            for name in g.all_players:
+                g.movePlayer(name, random.choice(list(Moveset)))
+
+        legacy = timeit(lambda: tick(lambda: deepcopy(board)), 5)
+        snapshot = timeit(lambda: tick(g.map.snapshot), 5)
+        print(f"{f'{size}x{size}':>10} {legacy * 1e3:>12.3f} {snapshot * 1e3:>12.3f}")
+
+
+@benchmark
+def roundResolution():
+    print(f"{'players':>7} {'movePlayer ms':>14} {'applyMoves ms':>14} {'with details ms':>15}")
+    for numPlayers, size in ((2, 10), (20, 40), (200, 120), (1000, 300)):
+        teams = {'TeamA': [f'A{i}' for i in range(numPlayers // 2)],
+                 'TeamB': [f'B{i}' for i in range(numPlayers - numPlayers // 2)]}
+        rounds = [{name: random.choice(list(Moveset)) for name in teams['TeamA'] + teams['TeamB']} for _ in range(20)]
+        g = Game(teams, size, size, seed=0)
+        looped = timeit(lambda: [g.movePlayer(name, move) for moves in rounds for name, move in moves.items()], 5)
+        g = Game(teams, size, size, seed=0)
+        batched = timeit(lambda: [g.applyMoves(moves) for moves in rounds], 5)
+        g = Game(teams, size, size, seed=0)
+        detailed = timeit(lambda: [g.applyMoves(moves, details=True) for moves in rounds], 5)
+        print(f"{numPlayers:>7} {looped / len(rounds) * 1e3:>14.3f} {batched / len(rounds) * 1e3:>14.3f} "
+              f"{detailed / len(rounds) * 1e3:>15.3f}")
+
+
+class LegacyPlayer:
+    """
+    Player before __slots__, loc behind an asserting property
+    """
+
+    def __init__(self, playerName: str, team):
+        self.__name = playerName
+        self.__team = team
+        self.__loc = None
+
+    @property
+    def loc(self):
+        return self.__loc
+
+    @loc.setter
+    def loc(self, value):
+        assert isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], int) and isinstance(value[1], int)
+        self.__loc = value
+
+
+@benchmark
+def entityModel():
+    # Run with python -O as well, loc is then a plain slot
+    numCoins, numPlayers, moves = 50000, 1000, 200000
+    _, legacyCoins = allocated(lambda: [LegacyCoin1() for _ in range(numCoins)])
+    _, coins = allocated(lambda: [Coin1() for _ in range(numCoins)])
+    _, legacyPlayers = allocated(lambda: [LegacyPlayer(f'Player{i}', None) for i in range(numPlayers)])
+    _, players = allocated(lambda: [Player(f'Player{i}', None) for i in range(numPlayers)])
+    print(f"{numCoins} coins: {legacyCoins / 2**20:.2f} MB -> {coins / 2**20:.2f} MB")
+    print(f"{numPlayers} players: {legacyPlayers / 2**10:.1f} KB -> {players / 2**10:.1f} KB")
+
+    locs = [(i % 100, i // 100 % 100) for i in range(moves)]
+
+    def move(player):
+        for loc in locs:
+            player.loc = loc
+            player.loc
+
+    legacy = timeit(lambda: move(LegacyPlayer('Player', None)), 3)
+    slotted = timeit(lambda: move(Player('Player', None)), 3)
+    print(f"loc update + read: {legacy / moves * 1e9:.0f} ns -> {slotted / moves * 1e9:.0f} ns "
+          f"({'optimized' if not __debug__ else 'debug'} mode)")
+
+
+@benchmark
+def stateDelta():
+    for size, teams, players, radius in ((10, 2, 2, 2), (50, 4, 10, 2), (50, 4, 10, 5)):
+        names = {f'Team{t}': [f'Team{t}Player{p}' for p in range(players)] for t in range(teams)}
+        game = Game(names, size, size, seed=0)
+        bots = {name: AlgorithmBot(size, size, seed=i) for i, name in enumerate(game.all_players)}
+        encoder = DeltaEncoder()
+        decoders = {name: DeltaDecoder() for name in bots}
+        full = delta = rounds = 0
+        while not game.gameOver() and rounds < 200:
+            gameData = game.getAllGameData(radius)
+            for name, data in gameData.items():
+                message = json.dumps(encoder.encode(name, data))
+                full += len(json.dumps(data))
+                delta += len(message)
+                decoders[name].apply(json.loads(message))
+                encoder.ack(name, json.loads(message)['seq'])
+            game.applyMoves({name: bot.move(gameData[name]) for name, bot in bots.items()})
+            rounds += 1
+        print(f"{size}x{size}, {teams * players} players, radius {radius}, {rounds} rounds: "
+              f"{full / 2**10:.0f} KB full -> {delta / 2**10:.0f} KB delta ({delta / full:.0%})")
+
+
+@benchmark
+def wireFormat():
+    names = {f'Team{t}': [f'Team{t}Player{p}' for p in range(10)] for t in range(4)}
+    game = Game(names, 100, 100, seed=0)
+    for radius in (2, 5, 10):
+        allData = list(game.getAllGameData(radius).values())
+        jsonPayloads = [json.dumps(data) for data in allData]
+        binaryPayloads = [encodeGameData(data, radius) for data in allData]
+        jsonEncode = timeit(lambda: [json.dumps(data) for data in allData], 20)
+        binaryEncode = timeit(lambda: [encodeGameData(data, radius) for data in allData], 20)
+        jsonDecode = timeit(lambda: [json.loads(payload) for payload in jsonPayloads], 20)
+        binaryDecode = timeit(lambda: [decodeGameData(payload) for payload in binaryPayloads], 20)
+        n = len(allData)
+        print(f"radius {radius}: {sum(map(len, jsonPayloads)) / n:.0f} B json -> "
+              f"{sum(map(len, binaryPayloads)) / n:.0f} B binary, "
+              f"encode {jsonEncode / n * 1e6:.1f} -> {binaryEncode / n * 1e6:.1f} us, "
+              f"decode {jsonDecode / n * 1e6:.1f} -> {binaryDecode / n * 1e6:.1f} us")
+
+
+@benchmark
+def boardFrame():
+    from lobbyHandlers import changed_cells
+    for size, teams, players in ((10, 2, 2), (50, 4, 10), (200, 10, 10)):
+        names = {f'Team{t}': [f'Team{t}Player{p}' for p in range(players)] for t in range(teams)}
+        game = Game(names, size, size, seed=0)
+        states = sum(len(json.dumps(data)) for data in game.getAllGameData().values())
+        frame = encodeBoard(game.map.snapshot(), game.getScores())
+        encode = timeit(lambda: encodeBoard(game.map.snapshot(), game.getScores()), 20)
+        decode = timeit(lambda: decodeBoard(frame), 20)
+        moves = {name: random.choice(list(Moveset)) for name in game.all_players}
+        changed = list(changed_cells(game.applyMoves(moves, details=True), moves))
+        delta = encodeBoardDelta(1, changed, [game.map.code(loc) for loc in changed], size, game.getScores())
+        print(f"{size}x{size}, {teams * players} players: {teams * players} game_state messages {states} B -> "
+              f"1 board frame {len(frame)} B, encode {encode * 1e6:.0f} us, decode {decode * 1e6:.0f} us, "
+              f"delta frame of a round {len(delta)} B")
+
+
+@benchmark
+def distanceField():
+    # A collected coin only recomputes the cells it was nearest to instead of rebuilding the field
+    print(f"{'board':>10} {'build ms':>9} {'coin removed us':>16} {'distance us':>12} {'nextStep us':>12}")
+    for size in (10, 100, 1000):
+        game = Game({'TeamA': ['A0', 'A1'], 'TeamB': ['B0', 'B1']}, size, size, seed=0)
+        codes = game.map.snapshot().codes
+        build = timeit(lambda: DistanceField(codes), 3)
+        coins = [tuple(loc) for loc in np.argwhere((codes >= COIN1) & (codes <= COIN3))[:100].tolist()]
+        field = DistanceField(codes)
+        DistanceField(codes).removeCoin(coins[-1])
+        start = time.perf_counter()
+        for loc in coins:
+            field.removeCoin(loc)
+        removal = (time.perf_counter() - start) / len(coins)
+        rng = random.Random(0)
+        locs = [(rng.randrange(size), rng.randrange(size)) for _ in range(1000)]
+        distance = timeit(lambda: [game.distanceToNearestCoin(loc) for loc in locs], 3) / len(locs)
+        nextStep = timeit(lambda: [game.nextStepTowardCoin(loc) for loc in locs], 3) / len(locs)
+        print(f"{f'{size}x{size}':>10} {build * 1e3:>9.3f} {removal * 1e6:>16.1f} "
+              f"{distance * 1e6:>12.2f} {nextStep * 1e6:>12.2f}")
+
+
+@benchmark
+def viewportRender():
+    # Game states of one player drawn and rendered into a discarded stream, over a random walk that moves the window
+    # every round and for a player that stays put
+    print(f"{'board':>10} {'radius':>6} {'legacy us':>10} {'viewport us':>12} {'standing legacy us':>19} "
+          f"{'standing viewport us':>21}")
+    for size, radius in ((10, 2), (100, 2), (100, 10), (500, 25)):
+        game = Game({'TeamA': ['A0', 'A1'], 'TeamB': ['B0', 'B1']}, size, size, seed=0)
+        rng = random.Random(0)
+        states = []
+        for _ in range(200):
+            states.append(game.getGameData('A0', radius))
+            game.movePlayer('A0', rng.choice(list(Moveset)))
+        out = open(os.devnull, 'w')
+
+        def viewport(states):
+            view = Viewport(radius, size, size)
+            for gameData in states:
+                view.update('A0', gameData)
+                view.render('', out)
+
+        standing = states[:1] * len(states)
+        times = [timeit(lambda: [out.write(legacyViewport('A0', gameData, radius, size, size)) for gameData in walk], 3)
+                 for walk in (states, standing)]
+        cached = [timeit(lambda: viewport(walk), 3) for walk in (states, standing)]
+        print(f"{f'{size}x{size}':>10} {radius:>6} {times[0] / len(states) * 1e6:>10.1f} "
+              f"{cached[0] / len(states) * 1e6:>12.1f} {times[1] / len(states) * 1e6:>19.1f} "
+              f"{cached[1] / len(states) * 1e6:>21.1f}")
+        out.close()
+
+
+@benchmark
+def botPlanner():
+    teams = {f'Team{t}': [f'Team{t}Player{p}' for p in range(2)] for t in range(2)}
+    for bot in ('algorithm', 'planner'):
+        stats = runGames({'teams': teams, 'policies': bot}, 300, processes=1)
+        print(f"{bot}: {stats['finished']}/{stats['games']} finished, rounds/game mean {stats['rounds']['mean']:.1f}, "
+              f"median {stats['rounds']['median']}, {stats['gamesPerSecond']:.1f} games/s")
+
+
+@benchmark
+def roundLatency():
+    # What GameClient does per round of a spectated lobby: apply the moves, then encode every game_state and the board
+    # frame, a whole board every BOARD_KEYFRAME_FRAMES rounds and the changed cells otherwise
+    from lobbyHandlers import BOARD_KEYFRAME_FRAMES, changed_cells
+    print(f"{'board':>10} {'players':>7} {'radius':>6} {'new game ms':>12} {'moves ms':>9} {'game_state ms':>14} "
+          f"{'board frame ms':>15} {'round ms':>9}")
+    for size, players in ((10, 4), (100, 16), (500, 16), (1000, 16), (1000, 100)):
+        names = {f'Team{t}': [f'Team{t}Player{p}' for p in range(players // 4)] for t in range(4)}
+        start = time.perf_counter()
+        game = Game(names, size, size, seed=0, wallDensity=0.2)
+        newGame = time.perf_counter() - start
+        for radius in (2, 10):
+            rng = random.Random(0)
+            rounds = 20
+            moves = states = frames = 0.0
+            for frame in range(1, rounds + 1):
+                moveDict = {name: rng.choice(list(Moveset)) for name in game.all_players}
+                start = time.perf_counter()
+                result = game.applyMoves(moveDict, details=True)
+                moved = time.perf_counter()
+                [json.dumps(data) for data in game.getAllGameData(radius).values()]
+                encoded = time.perf_counter()
+                if frame % BOARD_KEYFRAME_FRAMES == 0:
+                    encodeBoard(game.map.snapshot(), game.getScores(), frame)
+                else:
+                    changed = list(changed_cells(result, moveDict))
+                    encodeBoardDelta(frame, changed, [game.map.code(loc) for loc in changed], size, game.getScores())
+                moves, states, frames = moves + moved - start, states + encoded - moved, frames + time.perf_counter() - encoded
+            print(f"{f'{size}x{size}':>10} {players:>7} {radius:>6} {newGame * 1e3:>12.1f} {moves / rounds * 1e3:>9.3f} "
+                  f"{states / rounds * 1e3:>14.3f} {frames / rounds * 1e3:>15.3f} "
+                  f"{(moves + states + frames) / rounds * 1e3:>9.3f}")
+
+
+@benchmark
+def largeBoard():
+    # Start up and memory of the biggest boards GameClient serves, peak is the most held while generating the map
+    print(f"{'board':>10} {'new game s':>11} {'peak MB':>8} {'kept MB':>8} {'window us':>10} {'game data ms':>13}")
+    names = {f'Team{t}': [f'Team{t}Player{p}' for p in range(4)] for t in range(4)}
+    for size in (1000, 3000):
+        tracemalloc.start()
+        start = time.perf_counter()
+        game = Game(names, size, size, seed=0)
+        newGame = time.perf_counter() - start
+        kept, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rng = random.Random(0)
+        rects = [(x, x + 20, y, y + 20) for x, y in ((rng.randrange(size - 20), rng.randrange(size - 20))
+                                                     for _ in range(1000))]
+        window = timeit(lambda: [game.map.window(*rect) for rect in rects], 3) / len(rects)
+        gameData = timeit(lambda: game.getAllGameData(10), 5)
+        print(f"{f'{size}x{size}':>10} {newGame:>11.3f} {peak / 2 ** 20:>8.1f} {kept / 2 ** 20:>8.1f} "
+              f"{window * 1e6:>10.2f} {gameData * 1e3:>13.3f}")
+
+
+@benchmark
+def endToEnd():
+    # GameClient and the bots talk through the in-memory broker, so this measures the server without the network.
+    # MQTT_TRANSPORT=paho with BROKER_TLS=0 and a broker on this machine measures the same setup over MQTT
+    import GameClient
+    from loadGenerator import LoadGenerator
+    transport = os.environ.get('MQTT_TRANSPORT', 'local')
+    connect = lambda clientId: create_client(clientId, transport=transport)
+    # pool None serves every lobby on one connection, otherwise each game runs on its own GameInstanceManager
+    for lobbies, encoding, pool in ((1, 'json', None), (20, 'json', None), (20, 'binary', None), (20, 'json', 4)):
+        # GameClient prints every publish and board
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            server = connect('GameClient')
+            GameClient.init_game_client(server, pool_size=pool, connect_instance=connect)
+            server.loop_start()
+            stats = LoadGenerator(lobbies, 2, 2, 2, 'algorithm', encoding=encoding, connect=connect).run(10, 0.5)
+            server.loop_stop()
+            server.disconnect()
+        latency = stats.get('latency', {'p50': float('nan'), 'p99': float('nan')})
+        mode = 'one connection' if pool is None else 'pooled instances'
+        print(f"{transport}, {lobbies} lobbies, {encoding}, {mode}: {stats['finished']}/{lobbies} games in {stats['seconds']:.1f}s, "
+              f"move -> game_state p50 {latency['p50'] * 1e3:.2f} ms, p99 {latency['p99'] * 1e3:.2f} ms, "
+              f"{stats['totalRoundsPerSecond']:.0f} rounds/s")
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f'== {name}')
+        BENCHMARKS[name]()
+        print()
@@ -0,0 +1,181 @@
+"""
+Bot policies choosing a move from the getGameData dict of their player
+"""
+
+import random
+from collections import deque
+from typing import Optional
+
+from gameItems import *
+from moveset import Moveset
+
+
+class Bot:
+    def __init__(self, height: int = 10, width: int = 10, seed: Optional[int] = None, visionRadius: int = 2):
+        """
+        :param height: board height, the game data does not say where the board ends
+        :param width: board width
+        :param seed: seed for bots that make random choices
+        :param visionRadius: vision radius of the game data, neither does it say how far the player sees
+        """
+        self.height = height
+        self.width = width
+        self.rng = random.Random(seed)
+        self.visionRadius = visionRadius
+
+    def move(self, gameData: dict) -> Moveset:
+        raise NotImplementedError
+
+    def neighbours(self, gameData: dict) -> dict[Moveset, str]:
+        """
+        :return: {move: 'coin', 'blocked' or 'free'} for the four cells next to the player
+        """
+        blocked = {tuple(loc) for key in ('walls', 'enemyPositions', 'teammatePositions') for loc in gameData[key]}
+        coins = {tuple(loc) for key in ('coin1', 'coin2', 'coin3') for loc in gameData[key]}
+        x, y = gameData['currentPosition']
+        cells = {}
+        for move in Moveset:
+            loc = x + move.value[0], y + move.value[1]
+            if not (0 <= loc[0] < self.height and 0 <= loc[1] < self.width) or loc in blocked:
+                cells[move] = 'blocked'
+            elif loc in coins:
+                cells[move] = 'coin'
+            else:
+                cells[move] = 'free'
+        return cells
+
+
+class DownBot(Bot):
+    """
+    Always moves down, the 'n/a' mode of PlayerClient
+    """
+
+    def move(self, gameData: dict) -> Moveset:
+        return Moveset.DOWN
+
+
+class RandomBot(Bot):
+    def move(self, gameData: dict) -> Moveset:
+        return self.rng.choice(list(Moveset))
+
+
+class AlgorithmBot(Bot):
+    """
+    The 'algorithm' mode of PlayerClient: takes a neighbouring coin if there is one, otherwise sweeps the board
+    vertically and horizontally, turning around when it runs into walls, players or the edge
+    """
+
+    def __init__(self, height: int = 10, width: int = 10, seed: Optional[int] = None, visionRadius: int = 2):
+        super().__init__(height, width, seed, visionRadius)
+        self.scaleUp = True
+        self.scaleRight = True
+
+    def move(self, gameData: dict) -> Moveset:
+        cells = self.neighbours(gameData)
+        top, bottom = cells[Moveset.UP] == 'blocked', cells[Moveset.DOWN] == 'blocked'
+        left, right = cells[Moveset.LEFT] == 'blocked', cells[Moveset.RIGHT] == 'blocked'
+
+        if (top and bottom) or (top and right and left) or (bottom and right and left):
+            self.scaleUp = not self.scaleUp
+        if (top and bottom and left) or (top and bottom and right) or (top and right and self.scaleRight) or \
+                (bottom and left and not self.scaleRight):
+            self.scaleRight = not self.scaleRight
+
+        for move in (Moveset.UP, Moveset.LEFT, Moveset.RIGHT, Moveset.DOWN):
+            if cells[move] == 'coin':
+                return move
+        if not top and self.scaleUp:
+            return Moveset.UP
+        if not bottom and not self.scaleUp:
+            return Moveset.DOWN
+        if not right and self.scaleRight:
+            return Moveset.RIGHT
+        if not left:
+            return Moveset.LEFT
+        return Moveset.DOWN
+
+
+class PlannerBot(Bot):
+    """
+    Remembers every cell it has seen and walks the shortest known route to the coin with the best value per step,
+    or to the nearest cell it has not seen yet when no coin is worth more
+    """
+    UNKNOWN = 0xFF
+    # Value of reaching an unseen cell, below a Coin1 so a known coin wins at the same distance
+    EXPLORE_VALUE = 0.5
+    VALUES = {COIN1: Coin1.value, COIN2: Coin2.value, COIN3: Coin3.value}
+    MAX_VALUE = max(VALUES.values())
+    STEPS = tuple((move, *move.value) for move in Moveset)
+
+    def __init__(self, height: int = 10, width: int = 10, seed: Optional[int] = None, visionRadius: int = 2):
+        super().__init__(height, width, seed, visionRadius)
+        # Last seen cell code of every cell by row, UNKNOWN until seen. Players are not remembered, they move
+        self.memory = [bytearray([self.UNKNOWN]) * width for _ in range(height)]
+
+    def remember(self, gameData: dict):
+        """
+        Overwrites the cells in view with what the game data shows, coins taken by others disappear this way
+        """
+        x, y = gameData['currentPosition']
+        r = self.visionRadius
+        minY, maxY = max(y - r, 0), min(y + r + 1, self.width)
+        for row in self.memory[max(x - r, 0):x + r + 1]:
+            row[minY:maxY] = bytes([EMPTY]) * (maxY - minY)
+        for key, code in (('walls', WALL), ('coin1', COIN1), ('coin2', COIN2), ('coin3', COIN3)):
+            for locX, locY in gameData[key]:
+                self.memory[locX][locY] = code
+
+    def move(self, gameData: dict) -> Moveset:
+        self.remember(gameData)
+        planned = self.plan(gameData)
+        cells = self.neighbours(gameData)
+        if planned is not None and cells[planned] != 'blocked':
+            return planned
+        # A player stands in the way, waiting (a blocked move) or stepping aside at random keeps two bots from
+        # mirroring each other forever
+        free = [move for move, cell in cells.items() if cell != 'blocked']
+        if planned is not None:
+            free.append(planned)
+        return self.rng.choice(free) if free else Moveset.DOWN
+
+    def plan(self, gameData: dict) -> Optional[Moveset]:
+        """
+        Breadth first search over remembered cells that are not walls, with unseen cells assumed open. Players are
+        left out as they move on, see move. Grid steps all cost one, so BFS finds the same routes A* would, to every
+        target at once
+        :return: first move of the route to the best target, None if nothing is reachable
+        """
+        memory = self.memory
+        height, width = self.height, self.width
+        start = tuple(gameData['currentPosition'])
+        # First move of the route to every visited cell
+        firstMove = {start: None}
+        frontier = deque([(start, 0)])
+        best, bestScore = None, 0.0
+        while frontier:
+            (x, y), distance = frontier.popleft()
+            # No target further away can beat the best score
+            if best is not None and self.MAX_VALUE / (distance + 1) <= bestScore:
+                break
+            for move, dx, dy in self.STEPS:
+                loc = x + dx, y + dy
+                if not (0 <= loc[0] < height and 0 <= loc[1] < width) or loc in firstMove:
+                    continue
+                code = memory[loc[0]][loc[1]]
+                if code == WALL:
+                    continue
+                firstMove[loc] = firstMove[(x, y)] or move
+                value = self.EXPLORE_VALUE if code == self.UNKNOWN else self.VALUES.get(code, 0)
+                if value and value / (distance + 1) > bestScore:
+                    best, bestScore = loc, value / (distance + 1)
+                frontier.append((loc, distance + 1))
+        return None if best is None else firstMove[best]
+
+
+# Bot classes by the mode name used in PlayerClient and the simulation
+BOTS = {
+    'n/a': DownBot,
+    'random': RandomBot,
+    'algorithm': AlgorithmBot,
+    'planner': PlannerBot,
+}
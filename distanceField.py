@@ -0,0 +1,112 @@
+from typing import Optional
+
+import numpy as np
+
+from gameItems import *
+from moveset import Moveset
+
+
+class DistanceField:
+    """
+    Walking distance from every cell to its nearest coin around the walls, and which coin that is. Walls never move,
+    so the field is built once with a multi-source BFS and only the cells that led to a collected coin are recomputed.
+    Players are not obstacles, they move
+    """
+
+    def __init__(self, codes: np.ndarray):
+        """
+        :param codes: cell code grid of the map, see gameItems
+        """
+        self.height, self.width = codes.shape
+        flat = codes.reshape(-1)
+        self.__passable = flat != WALL
+        # Steps to the nearest coin and flat index of that coin, -1 for walls and cells no coin can be reached from
+        self.distances = np.full(flat.size, -1, dtype=np.int32)
+        self.sources = np.full(flat.size, -1, dtype=np.int64)
+
+        coins = np.flatnonzero((flat >= COIN1) & (flat <= COIN3))
+        self.distances[coins] = 0
+        self.sources[coins] = coins
+        self.__spread(coins, 0, coins[:0])
+
+    def distance(self, loc: tuple[int, int]) -> Optional[int]:
+        """
+        :return: steps from loc to the nearest coin, None if no coin can be reached
+        """
+        distance = self.distances.item(loc[0] * self.width + loc[1])
+        return None if distance < 0 else distance
+
+    def nextStep(self, loc: tuple[int, int]) -> Optional[Moveset]:
+        """
+        :return: move along a shortest route to the nearest coin, None on a coin or if no coin can be reached
+        """
+        index = loc[0] * self.width + loc[1]
+        distance = self.distances.item(index)
+        if distance <= 0:
+            return None
+        fallback = None
+        for move in Moveset:
+            x, y = loc[0] + move.value[0], loc[1] + move.value[1]
+            if 0 <= x < self.height and 0 <= y < self.width and self.distances.item(x * self.width + y) == distance - 1:
+                # Heads for the coin the distance was measured to, any neighbour one step closer otherwise
+                if self.sources.item(x * self.width + y) == self.sources.item(index):
+                    return move
+                fallback = fallback or move
+        return fallback
+
+    def removeCoin(self, loc: tuple[int, int]):
+        """
+        Recomputes the cells whose nearest coin was the one at loc. Every other cell keeps its distance, its coin is
+        still there and no distance grows shorter when a coin goes
+        """
+        index = loc[0] * self.width + loc[1]
+        if self.sources.item(index) != index:
+            return
+        region = np.flatnonzero(self.sources == index)
+        self.distances[region] = -1
+        self.sources[region] = -1
+
+        # The cells around the region keep their distances and spread them back into it
+        neighbours, _ = self.__neighbours(region)
+        seeds = np.unique(neighbours[self.sources[neighbours] >= 0])
+        if seeds.size:
+            seeds = seeds[np.argsort(self.distances[seeds], kind='stable')]
+            level = self.distances[seeds[0]]
+            first = np.searchsorted(self.distances[seeds], level, side='right')
+            self.__spread(seeds[:first], level, seeds[first:])
+
+    def __spread(self, frontier: np.ndarray, level: int, pending: np.ndarray):
+        """
+        Breadth first search outwards from frontier, the cells at distance level
+        :param pending: cells with known distances above level sorted by distance, each joins the frontier of its level
+        """
+        distances, sources = self.distances, self.sources
+        while frontier.size or pending.size:
+            if not frontier.size:
+                # Nothing left to grow at this level, continue from the closest pending cells
+                level = distances[pending[0]]
+                count = np.searchsorted(distances[pending], level, side='right')
+                frontier, pending = pending[:count], pending[count:]
+            neighbours, parents = self.__neighbours(frontier)
+            unvisited = self.__passable[neighbours] & (distances[neighbours] < 0)
+            neighbours, first = np.unique(neighbours[unvisited], return_index=True)
+            level += 1
+            distances[neighbours] = level
+            sources[neighbours] = sources[parents[unvisited][first]]
+
+            count = np.searchsorted(distances[pending], level, side='right')
+            frontier = np.concatenate((neighbours, pending[:count]))
+            pending = pending[count:]
+
+    def __neighbours(self, cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: flat indexes of the in-bounds cells next to cells, and the cell each one is next to
+        """
+        width = self.width
+        columns = cells % width
+        up = cells[cells >= width]
+        down = cells[cells < self.distances.size - width]
+        left = cells[columns > 0]
+        right = cells[columns < width - 1]
+        return (np.concatenate((up - width, down + width, left - 1, right + 1)),
+                np.concatenate((up, down, left, right)))
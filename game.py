@@ -3,24 +3,50 @@ Author: Charles Lee
 """
 
 from map import Map
+from distanceField import DistanceField
 from moveset import Moveset
 from player import Player
 from team import Team
 from gameItems import *
-import random
+from typing import Optional
+import numpy as np
 
 class Game:
-    def __init__(self, playerNames: dict[str,list[str]], width: int = 10, height: int = 10):
+    # Windows with fewer cells than this are scanned in Python, the NumPy calls cost more than they save
+    VECTORIZE_MIN_CELLS = 1000
+    # Lobbies whose windows add up to fewer cells than this build their game data player by player
+    BATCH_MIN_CELLS = 250
+
+    def __init__(self, playerNames: dict[str,list[str]], width: int = 10, height: int = 10, seed: Optional[int] = None,
+                 rng: Optional[np.random.Generator] = None, wallDensity: Optional[float] = None):
         """
         :param playerNames: Dictionary for each team name with a list of player names
+        :param seed: seed of the game's random generator, a fresh one is drawn and kept in self.seed when None
+        :param rng: generator used instead of seeding one, self.seed is None then
+        :param wallDensity: fraction of the board covered by walls, see Map
         """
+        if rng is None:
+            self.seed = np.random.SeedSequence().entropy if seed is None else seed
+            rng = np.random.default_rng(self.seed)
+        else:
+            self.seed = None
+        self.rng = rng
         self.numTeams = len(playerNames)
 
         self.teams, self.all_players = self.__initializePlayers(playerNames)
 
         self.__height = height
         self.__width = width
-        self.map = Map(height, width, list(self.all_players.values()))
+        self.map = Map(height, width, list(self.all_players.values()), rng=self.rng, wallDensity=wallDensity)
+
+        # Team index of each player cell code, -1 for other codes
+        teamIndex = {team: i for i, team in enumerate(self.teams.values())}
+        self.__codeTeams = np.full(PLAYER + len(self.all_players), -1, dtype=np.int32)
+        for player in self.all_players.values():
+            self.__codeTeams[self.map.playerCode(player)] = teamIndex[player.team]
+
+        # Coin distances around the walls, built on the first query and then updated as coins are collected
+        self.__distanceField: Optional[DistanceField] = None
 
     def __initializePlayers(self, playerNames: dict[str,list[str]]):
         teams = {}
@@ -34,26 +60,90 @@ class Game:
 
     def movePlayer(self, playerName: str, move: Moveset):
         assert isinstance(move, Moveset)
-        player = self.getPlayer(playerName)
+        self.__move(self.getPlayer(playerName), move)
+
+    def applyMoves(self, moves: dict[str, Moveset], details: bool = False) -> dict:
+        """
+        Validates and applies a whole round. Moves are applied in the order of the dict, so a player may step into a
+        cell vacated earlier in the round, and when several players target the same cell the first one gets it while
+        the others are blocked. Nothing is moved if any player name or move is invalid.
+        :raises TypeError: if a move is not a Moveset
+        :param moves: {playerName: move, ...}
+        :param details: also return the outcome of every move, which costs about as much as the moves themselves
+        :return: {
+            coinsCollected: int,
+            scoreDeltas: {teamName: points scored this round, ...} for teams that scored,
+            players: {playerName: {moved: bool, position: (x,y), coin: value collected or 0}, ...} with details
+        }
+        """
+        allPlayers = self.all_players
+        for playerName, move in moves.items():
+            # Checked even under python -O, a failed assert here would leave the round half applied
+            if move.__class__ is not Moveset:
+                raise TypeError(f'{move!r} is not a Moveset')
+            if playerName not in allPlayers:
+                raise KeyError(f'{playerName} is not a valid player name')
+
+        players = {}
+        coinsCollected = 0
+        scoreDeltas = {}
+        # The steps of __move with the lookups made once per round instead of once per move
+        height, width = self.__height, self.__width
+        code, moveCode = self.map.code, self.map.moveCode
+        distanceField = self.__distanceField
+        for playerName, direction in moves.items():
+            player = allPlayers[playerName]
+            x, y = player.loc
+            dx, dy = direction.value
+            loc = (x + dx, y + dy)
+            coin = None
+            if 0 <= loc[0] < height and 0 <= loc[1] < width:
+                cell = code(loc)
+                if cell != WALL and cell < PLAYER:
+                    coin = 0
+                    if cell != EMPTY:
+                        coin = cell - COIN1 + 1
+                        team = player.team
+                        team.increaseScore(coin)
+                        coinsCollected += 1
+                        scoreDeltas[team.name] = scoreDeltas.get(team.name, 0) + coin
+                        if distanceField is not None:
+                            distanceField.removeCoin(loc)
+                    moveCode(player.loc, loc)
+                    player.loc = loc
+            if details:
+                players[playerName] = {'moved': coin is not None, 'position': player.loc, 'coin': coin or 0}
 
+        result = {'coinsCollected': coinsCollected, 'scoreDeltas': scoreDeltas}
+        if details:
+            result['players'] = players
+        return result
+
+    def __move(self, player: Player, move: Moveset) -> Optional[int]:
+        """
+        :return: value of the coin collected, 0 for none, None if the move was blocked
+        """
         x, y = player.loc
         dx, dy = move.value
         new_loc = x+dx, y+dy
 
         if not (0 <= new_loc[0] < self.__height) or not (0 <= new_loc[1] < self.__width):
-            return
+            return None
 
-        cell = self.map.get(new_loc)
-        if isinstance(cell, Player) or isinstance(cell, Wall):
-            return
+        code = self.map.code(new_loc)
+        if code == WALL or code >= PLAYER:
+            return None
 
-        if isinstance(cell, Coin):
-            player.team.increaseScore(cell.value)
-            self.map.decreaseCoin()
+        coin = 0
+        if code != EMPTY:
+            coin = code - COIN1 + 1
+            player.team.increaseScore(coin)
+            if self.__distanceField is not None:
+                self.__distanceField.removeCoin(new_loc)
 
-        self.map.set(player.loc, None)
-        self.map.set(new_loc, player)
+        self.map.moveCode(player.loc, new_loc)
         player.loc = new_loc
+        return coin
 
     def getPlayer(self, playerName: str) -> Player:
         assert isinstance(playerName, str)
@@ -94,29 +184,117 @@ class Game:
                     'coin3': [],
                     'walls': []}
 
-        for x in range(minX, maxX+1):
-            for y in range(minY, maxY+1):
-                cell = self.map.get((x,y))
-                self.__addGameData(gameData, cell, (x,y), player)
+        window = self.map.window(minX, maxX, minY, maxY)
+        if window.size < Game.VECTORIZE_MIN_CELLS:
+            for x, row in enumerate(window.tolist(), minX):
+                for y, code in enumerate(row, minY):
+                    if code != EMPTY:
+                        self.__addGameData(gameData, code, (x,y), player)
+            return gameData
+
+        # Occupied cells and their codes, both row major
+        occupied = window != EMPTY
+        cells = np.argwhere(occupied) + (minX, minY)
+        codes = window[occupied]
+        positions = lambda mask: list(map(tuple, cells[mask].tolist()))
+        for code, key in self.__CODE_KEYS.items():
+            gameData[key] = positions(codes == code)
 
+        teams = self.__codeTeams[codes]
+        playerCode = self.map.playerCode(player)
+        teamIndex = self.__codeTeams[playerCode]
+        teammates = (teams == teamIndex) & (codes != playerCode)
+        gameData['teammateNames'] = [self.map.player(code).name for code in codes[teammates].tolist()]
+        gameData['teammatePositions'] = positions(teammates)
+        gameData['enemyPositions'] = positions((teams != teamIndex) & (codes >= PLAYER))
         return gameData
 
-    def __addGameData(self, gameData: dict, cell: object, loc: tuple[int, int], player: Player):
-        if isinstance(cell, Player):
-            if cell.team is player.team and cell is not player:
-                gameData['teammateNames'].append(cell.name)
+    __CODE_KEYS = {WALL: 'walls', COIN1: 'coin1', COIN2: 'coin2', COIN3: 'coin3'}
+
+    def __addGameData(self, gameData: dict, code: int, loc: tuple[int, int], player: Player):
+        if code >= PLAYER:
+            other = self.map.player(code)
+            if other.team is player.team and other is not player:
+                gameData['teammateNames'].append(other.name)
                 gameData['teammatePositions'].append(loc)
-            elif cell.team is not player.team:
+            elif other.team is not player.team:
                 gameData['enemyPositions'].append(loc)
-        elif isinstance(cell, Coin1):
-            gameData['coin1'].append(loc)
-        elif isinstance(cell, Coin2):
-            gameData['coin2'].append(loc)
-        elif isinstance(cell, Coin3):
-            gameData['coin3'].append(loc)
-        elif isinstance(cell, Wall):
-            gameData['walls'].append(loc)
+        else:
+            gameData[self.__CODE_KEYS[code]].append(loc)
     
+    def getAllGameData(self, visionRadius: int = 2) -> dict[str, dict]:
+        """
+        Builds getGameData for every player in one pass: the vision windows of all players are gathered from the map
+        in a single vectorized read and only the occupied cells are sorted into each player's data.
+        :param visionRadius:
+        :return: {playerName: getGameData(playerName, visionRadius), ...}
+        """
+        assert isinstance(visionRadius, int)
+        players = list(self.all_players.values())
+        if len(players) * (2 * visionRadius + 1) ** 2 < Game.BATCH_MIN_CELLS:
+            return {player.name: self.getGameData(player.name, visionRadius) for player in players}
+
+        span = np.arange(-visionRadius, visionRadius + 1)
+        xs = np.array([player.loc[0] for player in players])[:, None, None] + span[None, :, None]
+        ys = np.array([player.loc[1] for player in players])[:, None, None] + span[None, None, :]
+        xs, ys = np.broadcast_arrays(xs, ys)
+        inside = (0 <= xs) & (xs < self.__height) & (0 <= ys) & (ys < self.__width)
+        codes = np.zeros(xs.shape, dtype=np.int64)
+        codes[inside] = self.map.gather(xs[inside], ys[inside])
+
+        # Occupied cells of every window, row major within each player's window
+        hits = np.nonzero(codes)
+        owners = hits[0]
+        codes = codes[hits]
+        playerCodes = np.array([self.map.playerCode(player) for player in players])
+        teams = self.__codeTeams[codes]
+        ownTeams = self.__codeTeams[playerCodes][owners]
+        # Coins and walls keep their code, enemies become PLAYER, teammates PLAYER + 1 and the player itself EMPTY
+        kinds = np.where(codes < PLAYER, codes,
+                         np.where(teams != ownTeams, PLAYER, np.where(codes != playerCodes[owners], PLAYER + 1, EMPTY)))
+
+        allData = {}
+        for player in players:
+            allData[player.name] = {'teammateNames': [],
+                                    'teammatePositions': [],
+                                    'enemyPositions': [],
+                                    'currentPosition': player.loc,
+                                    'coin1': [],
+                                    'coin2': [],
+                                    'coin3': [],
+                                    'walls': []}
+        keys = (None, 'walls', 'coin1', 'coin2', 'coin3', 'enemyPositions', 'teammatePositions')
+        lists = [[None] + [gameData[key] for key in keys[1:]] for gameData in allData.values()]
+        teammateNames = [gameData['teammateNames'] for gameData in allData.values()]
+        for owner, kind, x, y, code in zip(owners.tolist(), kinds.tolist(), xs[hits].tolist(), ys[hits].tolist(),
+                                           codes.tolist()):
+            if kind != EMPTY:
+                lists[owner][kind].append((x, y))
+                if kind == PLAYER + 1:
+                    teammateNames[owner].append(self.map.player(code).name)
+
+        return allData
+
+    def distanceField(self) -> DistanceField:
+        """
+        Builds the coin distance field on the first call, later calls return it kept up to date with the moves made
+        """
+        if self.__distanceField is None:
+            self.__distanceField = DistanceField(self.map.snapshot().codes)
+        return self.__distanceField
+
+    def distanceToNearestCoin(self, loc: tuple[int, int]) -> Optional[int]:
+        """
+        :return: steps from loc to the nearest coin around the walls, None if no coin can be reached
+        """
+        return self.distanceField().distance(loc)
+
+    def nextStepTowardCoin(self, loc: tuple[int, int]) -> Optional[Moveset]:
+        """
+        :return: first move of a shortest route from loc to the nearest coin, None on a coin or if none can be reached
+        """
+        return self.distanceField().nextStep(loc)
+
     def gameOver(self):
         return self.map.numCoins <= 0
 
@@ -128,8 +306,7 @@ class Game:
 
 
 if __name__ == '__main__':
-    random.seed(1)
-    g = Game({'TeamA': ['Charles', 'Girish'], 'TeamB': ['James']})
+    g = Game({'TeamA': ['Charles', 'Girish'], 'TeamB': ['James']}, seed=1)
     print(g.map)
     print(g.getScores())
     multiMove = lambda name, moves: [g.movePlayer(name, move) for move in moves]
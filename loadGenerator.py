@@ -0,0 +1,211 @@
+"""
+Load generator for GameClient: plays many bot players across many lobbies over a few MQTT connections and reports the
+move to game_state round trip latency and the rounds per second of every lobby
+Usage: python loadGenerator.py --lobbies 50 --teams 2 --players 2 --connections 4 --think 0.1 --duration 60
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+import statistics
+
+from bots import BOTS
+from stateDelta import DeltaDecoder
+from tickScheduler import TickScheduler
+from wireFormat import decodeGameData, encodeMove
+from transport import create_client
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class LoadGenerator():
+    def __init__(self, lobbies=10, teams=2, players=2, connections=2, bot='algorithm', think=0.0, encoding='json',
+                 delta=False, seed=0, connect=create_client, width=10, height=10, vision_radius=2, wall_density=None):
+        """
+        :param lobbies: number of lobbies, each with teams teams of players bots
+        :param connections: MQTT connections the lobbies are spread over
+        :param bot: bot mode of every player, see bots.BOTS
+        :param think: mean think time in seconds between a game_state and the bot's move, drawn exponentially
+        :param encoding: message encoding asked for when creating the lobbies, json or binary
+        :param delta: ask for delta encoded game states
+        :param connect: function making a connected client from a client id, see transport.create_client
+        :param width: board settings of the lobbies, see InputTypes.LobbyConfig
+        """
+        self.think = think
+        self.encoding = encoding
+        self.delta = delta
+        self.config = {'width': width, 'height': height, 'vision_radius': vision_radius}
+        if wall_density is not None:
+            self.config['wall_density'] = wall_density
+        self.rng = random.Random(seed)
+        run_id = f'{self.rng.randrange(16 ** 4):04x}'
+
+        self.lobbies = {f'load{run_id}_{i}': {f'T{t}': [f'L{i}T{t}P{p}' for p in range(players)] for t in range(teams)}
+                        for i in range(lobbies)}
+        self.clients = [connect(f'load{run_id}_{i}') for i in range(connections)]
+        self.client_of = {}  # {lobby_name : client}
+        self.first_player = {lobby_name: next(iter(teams.values()))[0] for lobby_name, teams in self.lobbies.items()}
+        self.bots = {}  # {player_name : Bot}
+        self.game_data = {}  # {player_name : latest game data}
+        self.decoders = {}  # {player_name : DeltaDecoder}
+        self.move_sent = {}  # {player_name : time the pending move was published}
+        self.latencies = []
+        self.frames = {lobby_name: [] for lobby_name in self.lobbies}  # {lobby_name : [time of every round's game_state]}
+        self.finished = set()
+        self.lock = threading.Lock()
+        self.ticks = TickScheduler()
+        self.stop = threading.Event()
+
+        for i, (lobby_name, teams) in enumerate(self.lobbies.items()):
+            client = self.clients[i % connections]
+            self.client_of[lobby_name] = client
+            for names in teams.values():
+                for name in names:
+                    self.bots[name] = BOTS[bot](height, width, seed=self.rng.randrange(2 ** 32), visionRadius=vision_radius)
+        for client in self.clients:
+            client.on_message = self.on_message
+
+    def on_message(self, client, userdata, msg):
+        now = time.perf_counter()
+        topic_list = msg.topic.split('/')
+        lobby_name = topic_list[1]
+        with self.lock:
+            if topic_list[-1] == 'game_state':
+                # Every round sends each player a game_state, the first player's count the rounds
+                if topic_list[2] == self.first_player[lobby_name]:
+                    self.frames[lobby_name].append(now)
+                self.receive_game_state(client, lobby_name, topic_list[2], msg.payload, now)
+            elif topic_list[-1] == 'lobby' and msg.payload.decode(errors='replace').startswith('Game Over'):
+                self.finished.add(lobby_name)
+                if len(self.finished) == len(self.lobbies):
+                    self.stop.set()
+
+    def receive_game_state(self, client, lobby_name, player_name, payload, now):
+        game_data = json.loads(payload) if payload[:1] == b'{' else decodeGameData(payload)
+        if 'seq' in game_data:
+            seq = game_data['seq']
+            game_data = self.decoders.setdefault(player_name, DeltaDecoder()).apply(game_data)
+            if game_data is None:
+                return
+            client.publish(f'games/{lobby_name}/{player_name}/ack', seq)
+        self.game_data[player_name] = game_data
+
+        sent = self.move_sent.pop(player_name, None)
+        if sent is not None:
+            self.latencies.append(now - sent)
+        if lobby_name not in self.finished:
+            self.ticks.schedule((lobby_name, player_name), self.rng.expovariate(1 / self.think) if self.think else 0)
+
+    def send_move(self, key):
+        lobby_name, player_name = key
+        with self.lock:
+            if lobby_name in self.finished:
+                return
+            move = self.bots[player_name].move(self.game_data[player_name])
+            payload = encodeMove(move) if self.encoding == 'binary' else move.name
+            self.move_sent[player_name] = time.perf_counter()
+        self.client_of[lobby_name].publish(f'games/{lobby_name}/{player_name}/move', payload)
+
+    def run(self, duration=60.0, join_wait=2.0):
+        """
+            Creates the lobbies, starts their games and plays until every game is over or duration seconds passed
+            :param join_wait: seconds between joining the players and starting the games
+            :return: report, see report()
+        """
+        for lobby_name, client in self.client_of.items():
+            for topic in ('+/game_state', 'lobby'):
+                client.subscribe(f'games/{lobby_name}/{topic}')
+        for client in self.clients:
+            client.loop_start()
+        ticker = threading.Thread(target=self.ticks.runForever, args=(self.send_move, self.stop), daemon=True)
+        ticker.start()
+
+        for lobby_name, teams in self.lobbies.items():
+            for team_name, names in teams.items():
+                for name in names:
+                    self.client_of[lobby_name].publish('new_game', json.dumps({'lobby_name' : lobby_name,
+                                                                             'team_name' : team_name,
+                                                                             'player_name' : name,
+                                                                             'delta' : self.delta,
+                                                                             'encoding' : self.encoding,
+                                                                             **self.config}))
+        time.sleep(join_wait)
+        start = time.perf_counter()
+        for lobby_name, client in self.client_of.items():
+            client.publish(f'games/{lobby_name}/start', 'START')
+
+        self.stop.wait(duration)
+        self.stop.set()
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            unfinished = [lobby_name for lobby_name in self.lobbies if lobby_name not in self.finished]
+        result = self.report(elapsed)
+        for lobby_name in unfinished:
+            self.client_of[lobby_name].publish(f'games/{lobby_name}/start', 'STOP')
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+        return result
+
+    def report(self, elapsed):
+        """
+            :return: {seconds, players, finished, moves, latency: {p50, p90, p99, max} in seconds,
+                      roundsPerSecond: {mean, min, max} over the lobbies, totalRoundsPerSecond}
+        """
+        with self.lock:
+            latencies = list(self.latencies)
+            rates = []
+            for times in self.frames.values():
+                # The first game_state is published at the start of the game, every later one ends a round
+                rates.append((len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0)
+        result = {'seconds': elapsed,
+                  'players': len(self.bots),
+                  'finished': len(self.finished),
+                  'moves': len(latencies),
+                  'totalRoundsPerSecond': sum(len(times) - 1 for times in self.frames.values() if times) / elapsed}
+        if latencies:
+            result['latency'] = {'p50': percentile(latencies, 0.5), 'p90': percentile(latencies, 0.9),
+                                 'p99': percentile(latencies, 0.99), 'max': max(latencies)}
+        if rates:
+            result['roundsPerSecond'] = {'mean': statistics.mean(rates), 'min': min(rates), 'max': max(rates)}
+        return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lobbies', type=int, default=10)
+    parser.add_argument('--teams', type=int, default=2, help='teams per lobby')
+    parser.add_argument('--players', type=int, default=2, help='players per team')
+    parser.add_argument('--connections', type=int, default=2, help='MQTT connections shared by all bots')
+    parser.add_argument('--bot', default='algorithm', choices=sorted(BOTS))
+    parser.add_argument('--think', type=float, default=0.0, help='mean bot think time in seconds')
+    parser.add_argument('--encoding', default='json', choices=('json', 'binary'))
+    parser.add_argument('--delta', action='store_true', help='ask for delta encoded game states')
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--height', type=int, default=10)
+    parser.add_argument('--vision', type=int, default=2, help='vision radius of the players')
+    parser.add_argument('--wall-density', type=float, default=None, help='fraction of the board covered by walls')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds to play for at most')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = LoadGenerator(args.lobbies, args.teams, args.players, args.connections, args.bot, args.think,
+                              args.encoding, args.delta, args.seed, width=args.width, height=args.height,
+                              vision_radius=args.vision, wall_density=args.wall_density)
+    stats = generator.run(args.duration)
+
+    print(f"{stats['players']} players in {args.lobbies} lobbies for {stats['seconds']:.1f}s, "
+          f"{stats['finished']} games finished, {stats['moves']} moves answered")
+    if 'latency' in stats:
+        latency = stats['latency']
+        print(f"move -> game_state latency: p50 {latency['p50'] * 1e3:.1f} ms, p90 {latency['p90'] * 1e3:.1f} ms, "
+              f"p99 {latency['p99'] * 1e3:.1f} ms, max {latency['max'] * 1e3:.1f} ms")
+    if 'roundsPerSecond' in stats:
+        rate = stats['roundsPerSecond']
+        print(f"rounds/s per lobby: mean {rate['mean']:.1f}, min {rate['min']:.1f}, max {rate['max']:.1f}, "
+              f"total {stats['totalRoundsPerSecond']:.1f}")
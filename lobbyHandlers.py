@@ -0,0 +1,351 @@
+"""
+Lobby handlers shared by every game server: GameClient in all its modes, GameInstanceManager and AsyncGameServer.
+Every function takes the server as client, which holds the per-lobby dicts of init_lobby_state, a
+TickScheduler as ticks, round_seconds, max_cells and publish(topic, payload)
+"""
+
+import json
+from collections import OrderedDict
+
+from InputTypes import NewPlayer, LobbyConfig, Start
+from game import Game
+from moveset import Moveset
+from stateDelta import DeltaEncoder
+from wireFormat import encodeGameData, encodeScores, encodeBoard, encodeBoardDelta, decodeMove
+# Per-lobby state of every server, one dict per name keyed by lobby name:
+#   team_dict           players before a game starts {'lobby_name' : {'started' : bool, 'team_name' : [player_name, ...]}}
+#   game_dict           Game of each started lobby
+#   move_dict           moves made this round {'lobby_name' : {'player_name' : Moveset}}
+#   delta_dict          DeltaEncoder of each started lobby
+#   delta_players       players that asked for delta game states {'lobby_name' : {player_name, ...}}
+#   encoding_dict       encoding of the messages of each lobby, 'json' or 'binary'
+#   round_seconds_dict  round length of each lobby, None waits for every move
+#   config_dict         LobbyConfig of each lobby
+#   board_dict          number of the last board frame of each spectated lobby
+LOBBY_STATE = ('team_dict', 'game_dict', 'move_dict', 'delta_dict', 'delta_players', 'encoding_dict',
+               'round_seconds_dict', 'config_dict', 'board_dict')
+
+
+def init_lobby_state(client):
+    """
+        Gives client an empty dict for every name of LOBBY_STATE
+    """
+    for name in LOBBY_STATE:
+        setattr(client, name, {})
+
+
+def handle_message(client, topic, payload):
+    topic_list = topic.split("/")
+
+    # Validate it is input we can deal with
+    if topic_list[-1] in dispatch.keys(): 
+        dispatch[topic_list[-1]](client, topic_list, payload)
+
+
+
+# Dispatched function, adds player to a lobby & team
+def add_player(client, topic_list, msg_payload):
+    # Parse and Validate Input Data
+    try:
+        player = NewPlayer(**json.loads(msg_payload))
+    except:
+        print("ValidationError in create_game")
+        return
+    
+    # If lobby doesn't exists...
+    if player.lobby_name not in client.team_dict.keys():
+        client.team_dict[player.lobby_name] = {}
+        client.team_dict[player.lobby_name]['started'] = False
+        # The first player of a lobby picks the encoding of its game_state and scores messages and its round length
+        client.encoding_dict[player.lobby_name] = player.encoding
+        client.round_seconds_dict[player.lobby_name] = player.round_seconds or client.round_seconds
+        client.config_dict[player.lobby_name] = LobbyConfig(**player.model_dump(include=set(LobbyConfig.model_fields)))
+    elif player.spectate:
+        # Any player can ask for the board frames of a lobby
+        client.config_dict[player.lobby_name] = client.config_dict[player.lobby_name].model_copy(update={'spectate': True})
+
+    if client.team_dict[player.lobby_name]['started']:
+        publish_error_to_lobby(client, player.lobby_name, "Game has already started, please make a new lobby")
+
+    add_team(client, player)
+    if player.delta:
+        client.delta_players.setdefault(player.lobby_name, set()).add(player.player_name)
+
+    print(f'Added Player: {player.player_name} to Team: {player.team_name}')
+
+
+def add_team(client, player):
+    # If team not in lobby, make new team and start a player list for the team
+    if player.team_name not in client.team_dict[player.lobby_name].keys():
+        client.team_dict[player.lobby_name][player.team_name] = [player.player_name,]    
+    # If team already exists, add player to existing list
+    else:
+        client.team_dict[player.lobby_name][player.team_name].append(player.player_name)
+
+move_to_Moveset = {
+    'UP' : Moveset.UP,
+    'DOWN' : Moveset.DOWN,
+    'LEFT' : Moveset.LEFT,
+    'RIGHT' : Moveset.RIGHT
+}
+
+# Boards with more cells are summarized instead of printed
+PRINT_MAX_CELLS = 2500
+# Largest board a lobby may ask for unless the server sets its own limit, a game takes a few times 2 bytes per cell
+MAX_BOARD_CELLS = 1000 * 1000
+
+# Dispatched Function: handles player movement commands
+def player_move(client, topic_list, msg_payload):
+    lobby_name = topic_list[1]
+    player_name = topic_list[2]
+    if lobby_name in client.team_dict.keys():
+        try:
+            # Moves are either a name or a single byte from wireFormat.encodeMove
+            if len(msg_payload) == 1:
+                new_move = decodeMove(msg_payload)
+            else:
+                new_move = move_to_Moveset[msg_payload.decode()]
+
+            game: Game = client.game_dict[lobby_name]
+            if player_name not in game.all_players:
+                publish_error_to_lobby(client, lobby_name, f"{player_name} is not in this game.")
+                return
+            client.move_dict[lobby_name][player_name] = new_move
+
+            # If all players made a move, resolve movement without waiting for the deadline
+            if len(game.all_players) == len(client.move_dict[lobby_name]):
+                resolve_round(client, lobby_name)
+
+        except Exception as e:
+            raise e
+            publish_error_to_lobby(client, lobby_name, e.__str__)
+    else:
+        publish_error_to_lobby(client, lobby_name, "Lobby name not found.")
+
+
+# Dispatched function: the round deadline of a lobby passed, delivered by the tick scheduler and never subscribed to
+def round_deadline(client, topic_list, msg_payload):
+    lobby_name = topic_list[1]
+    # A round resolved after the deadline was taken from the scheduler has already set the next one
+    if lobby_name in client.game_dict and not client.ticks.isScheduled(lobby_name):
+        resolve_round(client, lobby_name)
+
+
+def resolve_round(client, lobby_name):
+    """
+        Applies the moves made this round, players that did not move stay where they are, and publishes the results
+    """
+    game: Game = client.game_dict[lobby_name]
+    moves = client.move_dict[lobby_name]
+    # Only the board frames of spectated lobbies need to know where each player went
+    spectated = client.config_dict[lobby_name].spectate
+    result = game.applyMoves(moves, details=spectated)
+
+    # Publish player states after all movement is resolved
+    publish_game_states(client, lobby_name, game)
+    publish_board(client, lobby_name, game, changed_cells(result, moves) if spectated else ())
+
+    # Clear move list
+    client.move_dict[lobby_name].clear()
+    print_map(game)
+    # Scores only change when a coin was collected
+    if result['scoreDeltas']:
+        publish_scores(client, lobby_name, game)
+    if game.gameOver():
+        # Publish game over, remove game
+        publish_to_lobby(client, lobby_name, "Game Over: All coins have been collected")
+        remove_lobby(client, lobby_name)
+    else:
+        schedule_round(client, lobby_name)
+
+
+def schedule_round(client, lobby_name):
+    # Lobbies without a round length wait for every player's move
+    round_seconds = client.round_seconds_dict.get(lobby_name)
+    if round_seconds:
+        client.ticks.schedule(lobby_name, round_seconds)
+
+
+def print_map(game):
+    if game.map.height * game.map.width <= PRINT_MAX_CELLS:
+        print(game.map)
+    else:
+        print(f'{game.map.height}x{game.map.width} board, {game.map.numCoins} coins left')
+
+
+def parse_start(msg_payload):
+    """
+        :return: Start of a plain START or a JSON Start message with board settings, None for anything else
+    """
+    if msg_payload == b"START":
+        return Start(start="START")
+    if msg_payload[:1] == b"{":
+        try:
+            return Start(**json.loads(msg_payload))
+        except:
+            print("ValidationError in start_game")
+    return None
+
+
+def apply_start(client, lobby_name, start):
+    """
+        Replaces the lobby's board settings with the ones the Start message gives
+        :return: the lobby's settings
+    """
+    config = client.config_dict[lobby_name].model_copy(update=start.model_dump(exclude={'start'}, exclude_none=True))
+    client.config_dict[lobby_name] = config
+    return config
+
+
+def board_too_big(client, lobby_name, config):
+    """
+        Reports a board of more than client.max_cells cells to the lobby, before it takes the server's memory
+        :return: whether the board is too big
+    """
+    if config.width * config.height <= client.max_cells:
+        return False
+    publish_error_to_lobby(client, lobby_name, f"The board is too big, at most {client.max_cells} cells")
+    return True
+
+
+def board_too_small(client, lobby_name, config, teams):
+    """
+        Reports a board with fewer cells than players to the lobby
+        :return: whether the board is too small
+    """
+    if config.width * config.height >= sum(len(players) for players in teams.values()):
+        return False
+    publish_error_to_lobby(client, lobby_name, "The board is too small for all players")
+    return True
+
+
+# Dispatched function: Instantiates Game object
+def start_game(client, topic_list, msg_payload):
+    lobby_name = topic_list[1]
+    start = parse_start(msg_payload)
+    if start is not None:
+
+        if lobby_name in client.team_dict.keys():
+                # create new game
+                teams = {team: players for team, players in client.team_dict[lobby_name].items() if team != 'started'}
+                config = apply_start(client, lobby_name, start)
+                if board_too_big(client, lobby_name, config) or board_too_small(client, lobby_name, config, teams):
+                    return
+
+                game = Game(teams, config.width, config.height, wallDensity=config.wall_density)
+                print(f'Started lobby {lobby_name} with seed {game.seed}')
+                client.game_dict[lobby_name] = game
+                client.move_dict[lobby_name] = OrderedDict()
+                client.team_dict[lobby_name]["started"] = True
+                client.delta_dict[lobby_name] = DeltaEncoder()
+                client.board_dict.pop(lobby_name, None)
+
+                # Players size their maps from the board settings
+                client.publish(f'games/{lobby_name}/config', json.dumps(config.model_dump()))
+                publish_game_states(client, lobby_name, game)
+                publish_scores(client, lobby_name, game)
+                publish_board(client, lobby_name, game)
+                schedule_round(client, lobby_name)
+
+                print_map(game)
+    elif isinstance(msg_payload, bytes) and msg_payload.decode() == "STOP":
+        publish_to_lobby(client, lobby_name, "Game Over: Game has been stopped")
+        remove_lobby(client, lobby_name)
+
+
+def publish_game_states(client, lobby_name, game):
+    """
+        Publishes the game data of every player, binary in binary lobbies and otherwise JSON, as deltas for the
+        players that opted in when joining
+    """
+    vision_radius = client.config_dict[lobby_name].vision_radius
+    all_game_data = game.getAllGameData(vision_radius)
+    if client.encoding_dict.get(lobby_name) == 'binary':
+        for player, game_data in all_game_data.items():
+            client.publish(f'games/{lobby_name}/{player}/game_state', encodeGameData(game_data, vision_radius))
+        return
+
+    delta_players = client.delta_players.get(lobby_name, ())
+    encoder = client.delta_dict[lobby_name]
+    for player, game_data in all_game_data.items():
+        if player in delta_players:
+            game_data = encoder.encode(player, game_data)
+        client.publish(f'games/{lobby_name}/{player}/game_state', json.dumps(game_data))
+
+
+# A spectated lobby sends the whole board every this many frames and only the changed cells in between
+BOARD_KEYFRAME_FRAMES = 20
+
+
+def publish_board(client, lobby_name, game, changed=()):
+    """
+        Publishes a board frame with the scores in lobbies with spectate set, so spectators need a single
+        subscription. The first frame and every BOARD_KEYFRAME_FRAMES-th are the whole board, the others only hold the
+        cells in changed
+    """
+    if not client.config_dict[lobby_name].spectate:
+        return
+    frame = client.board_dict.get(lobby_name, -1) + 1
+    client.board_dict[lobby_name] = frame
+    if frame % BOARD_KEYFRAME_FRAMES == 0:
+        payload = encodeBoard(game.map.snapshot(), game.getScores(), frame)
+    else:
+        changed = list(changed)
+        payload = encodeBoardDelta(frame, changed, [game.map.code(loc) for loc in changed], game.map.width,
+                                   game.getScores())
+    client.publish(f'games/{lobby_name}/board', payload)
+
+
+def changed_cells(result, moves):
+    """
+        :param result: Game.applyMoves of moves with details
+        :return: cells a round changed, the ones the players that moved left and entered
+    """
+    cells = set()
+    for player_name, outcome in result['players'].items():
+        if outcome['moved']:
+            x, y = outcome['position']
+            dx, dy = moves[player_name].value
+            cells.update(((x, y), (x - dx, y - dy)))
+    return cells
+
+
+def publish_scores(client, lobby_name, game):
+    if client.encoding_dict.get(lobby_name) == 'binary':
+        client.publish(f'games/{lobby_name}/scores', encodeScores(game.getScores()))
+    else:
+        client.publish(f'games/{lobby_name}/scores', json.dumps(game.getScores()))
+
+
+# Dispatched function: a delta player confirms the game_state it has applied, later deltas are based on it
+def player_ack(client, topic_list, msg_payload):
+    lobby_name = topic_list[1]
+    player_name = topic_list[2]
+    if lobby_name in client.delta_dict:
+        try:
+            client.delta_dict[lobby_name].ack(player_name, int(msg_payload.decode()))
+        except ValueError:
+            print(f"Invalid ack from {player_name}: {msg_payload}")
+
+
+def remove_lobby(client, lobby_name):
+    for name in LOBBY_STATE:
+        getattr(client, name).pop(lobby_name, None)
+    client.ticks.cancel(lobby_name)
+
+
+def publish_error_to_lobby(client, lobby_name, error):
+    publish_to_lobby(client, lobby_name, f"Error: {error}")
+
+
+def publish_to_lobby(client, lobby_name, msg):
+    client.publish(f"games/{lobby_name}/lobby", msg)
+
+
+dispatch = {
+    'new_game' : add_player,
+    'move' : player_move,
+    'start' : start_game,
+    'ack' : player_ack,
+    'tick' : round_deadline,
+}
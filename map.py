@@ -2,11 +2,11 @@
 Author: Charles Lee
 """
 
-from copy import deepcopy
 from player import Player
-import random
 from gameItems import *
 from typing import Optional
+import numpy as np
+from spatialIndex import SpatialIndex
 
 def getDefaultWallChoices():
     wall = []
@@ -20,36 +20,115 @@ def getDefaultWallChoices():
     return wall
 
 
+def getScaledWallMask(height: int, width: int) -> np.ndarray:
+    """
+    Wall candidates for a board of any size, the default 10x10 layout repeated across it. The free first and last
+    column and last row of every tile keep the tiles connected
+    :return: (height, width) bool array marking the candidates, the default choices for a 10x10 board
+    """
+    tile = np.zeros((10, 10), dtype=bool)
+    tile[tuple(np.array(getDefaultWallChoices()).T)] = True
+    return np.tile(tile, (-(-height // 10), -(-width // 10)))[:height, :width]
+
+
+# Shared item per cell code below PLAYER, walls and coins carry no per-cell state
+CELL_ITEMS = (None, Wall(), Coin1(), Coin2(), Coin3())
+
+
+class MapSnapshot:
+    """
+    Read-only view of the map cells at the time it was taken, indexable like the old list of lists.
+    Players are the live objects, only their positions are frozen
+    """
+
+    def __init__(self, codes: np.ndarray, players: tuple[Player, ...]):
+        self.codes = codes
+        self.players = players
+
+    @property
+    def height(self):
+        return self.codes.shape[0]
+
+    @property
+    def width(self):
+        return self.codes.shape[1]
+
+    def get(self, loc: tuple[int, int]):
+        code = self.codes.item(loc)
+        return CELL_ITEMS[code] if code < PLAYER else self.players[code - PLAYER]
+
+    def __getitem__(self, row: int) -> list[object]:
+        return [CELL_ITEMS[code] if code < PLAYER else self.players[code - PLAYER] for code in self.codes[row].tolist()]
+
+    def __iter__(self):
+        for row in range(self.height):
+            yield self[row]
+
+    def __len__(self):
+        return self.height
+
+    def __repr__(self):
+        names = ['None', 'Wall', 'Coin1', 'Coin2', 'Coin3'] + [player.name for player in self.players]
+        return '\n'.join('\t'.join(names[code] for code in row) for row in self.codes.tolist())
+
+
 class Map:
     COIN_MIN_RATIO = 0.1
     COIN_MAX_RATIO = 0.2
     WALL_MIN_RATIO = 0.1
     WALL_MAX_RATIO = 0.3
 
-    def __init__(self, height: int, width: int, playersList: list[Player], wallChoices: list[tuple[int]] = None):
+    def __init__(self, height: int, width: int, playersList: list[Player], wallChoices: list[tuple[int]] = None,
+                 seed: Optional[int] = None, rng: Optional[np.random.Generator] = None,
+                 wallDensity: Optional[float] = None):
+        """
+        :param wallChoices: cells walls are drawn from, the cells of getScaledWallMask when None
+        :param seed: seed of the map generator, ignored when rng is given
+        :param rng: generator to draw the map from, a fresh one seeded with seed when None
+        :param wallDensity: fraction of the board to fill with walls, at most every wall choice. A random number
+                            between WALL_MIN_RATIO of the board and all wall choices when None
+        """
         assert isinstance(width, int) and isinstance(height, int)
         assert isinstance(playersList, list)
         self.__height = height
         self.__width = width
-        self.__map: list[list[object]] = [[None for _ in range(width)] for _ in range(height)]
+        # Cells are stored as codes (see gameItems), players are looked up through the player table
+        self.__grid = np.zeros((height, width), dtype=np.uint16)
+        self.__players: list[Player] = []
+        self.__playerIds: dict[Player, int] = {}
+        for player in playersList:
+            self.playerCode(player)
 
-        self.__numCoins = 0
+        # None stands for getScaledWallMask, which is built again by __fillMap rather than kept
+        self.wallChoices = wallChoices
 
-        self.wallChoices = getDefaultWallChoices() if wallChoices is None else wallChoices
+        self.__fillMap(playersList, np.random.default_rng(seed) if rng is None else rng, wallDensity)
 
-        self.__fillMap(playersList)
+        self.__numCoins = int(np.count_nonzero((self.__grid >= COIN1) & (self.__grid <= COIN3)))
+        # Snapshot sharing the current grid, the grid is copied before the next write while it is set
+        self.__snapshot: Optional[MapSnapshot] = None
+        # Positions of every entity type, indexed by cell code with players sharing PLAYER. Built on the first
+        # query and then kept in sync by setCode
+        self.__indexes: Optional[list[Optional[SpatialIndex]]] = None
 
 
     @property
     def numCoins(self):
         return self.__numCoins
-    
-    def decreaseCoin(self):
-        self.__numCoins -= 1
 
     @property
-    def map(self):
-        return deepcopy(self.__map)
+    def map(self) -> MapSnapshot:
+        return self.snapshot()
+
+    def snapshot(self) -> MapSnapshot:
+        """
+        O(1) read-only snapshot of the board, the first write made afterwards copies the grid instead of touching it
+        """
+        if self.__snapshot is None:
+            codes = self.__grid.view()
+            codes.flags.writeable = False
+            self.__snapshot = MapSnapshot(codes, tuple(self.__players))
+        return self.__snapshot
 
     @property
     def height(self):
@@ -60,69 +139,172 @@ class Map:
         return self.__width
 
     def __repr__(self):
-        result = []
-        for row in self.__map:
-            row_str = []
-            for cell in row:
-                if cell is None:
-                    cellName = 'None'
-                elif isinstance(cell, Player):
-                    cellName = cell.name
-                else:
-                    cellName = cell.__class__.__name__
-                row_str.append(cellName)
-            result.append('\t'.join(row_str))
-
-        output = '\n'.join(result)
-
-        return output
+        return repr(self.snapshot())
 
     def set(self, loc: tuple[int, int], item: object):
         assert isinstance(loc, tuple) and len(loc) == 2 and isinstance(loc[0], int) and isinstance(loc[1], int)
-        self.__map[loc[0]][loc[1]] = item
+        self.setCode(loc, self.__encode(item))
 
     def get(self, loc: tuple[int, int]):
         assert isinstance(loc, tuple) and len(loc) == 2 and isinstance(loc[0], int) and isinstance(loc[1], int)
-        return self.__map[loc[0]][loc[1]]
+        code = self.__grid.item(loc)
+        return CELL_ITEMS[code] if code < PLAYER else self.__players[code - PLAYER]
 
-    def __fillMap(self, players: list[Player]):
-        assert isinstance(players, list)
+    def code(self, loc: tuple[int, int]) -> int:
+        """
+        :return: cell code at loc, PLAYER + id for players
+        """
+        return self.__grid.item(loc)
+
+    def setCode(self, loc: tuple[int, int], code: int):
+        if self.__snapshot is not None:
+            self.__grid = self.__grid.copy()
+            self.__snapshot = None
+        old = self.__grid.item(loc)
+        self.__numCoins += (COIN1 <= code <= COIN3) - (COIN1 <= old <= COIN3)
+        if self.__indexes is not None:
+            if old != EMPTY:
+                self.__indexes[min(old, PLAYER)].discard(loc)
+            if code != EMPTY:
+                self.__indexes[min(code, PLAYER)].add(loc)
+        self.__grid[loc] = code
+
+    def moveCode(self, src: tuple[int, int], dst: tuple[int, int]) -> int:
+        """
+        Moves the code at src to dst and empties src, the same as two setCode calls
+        :return: code that was at dst
+        """
+        if self.__snapshot is not None:
+            self.__grid = self.__grid.copy()
+            self.__snapshot = None
+        grid = self.__grid
+        code, old = grid.item(src), grid.item(dst)
+        if COIN1 <= old <= COIN3:
+            self.__numCoins -= 1
+        if self.__indexes is not None:
+            if old != EMPTY:
+                self.__indexes[min(old, PLAYER)].discard(dst)
+            index = self.__indexes[min(code, PLAYER)]
+            index.discard(src)
+            index.add(dst)
+        grid[dst] = code
+        grid[src] = EMPTY
+        return old
+
+    def window(self, minX: int, maxX: int, minY: int, maxY: int) -> np.ndarray:
+        """
+        :return: view of the cell codes inside the inclusive bounds, must not be modified
+        """
+        return self.__grid[minX:maxX+1, minY:maxY+1]
+
+    def gather(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        :return: cell codes at the in-bounds coordinates (xs[i], ys[i])
+        """
+        return self.__grid[xs, ys]
+
+    def coinsInRect(self, minX: int, maxX: int, minY: int, maxY: int) -> dict[int, list[tuple[int, int]]]:
+        """
+        :return: {coin value: [(x,y),...]} for the coins inside the inclusive bounds, each list in row major order
+        """
+        indexes = self.__spatialIndexes()
+        return {value: indexes[COIN1 + value - 1].inRect(minX, maxX, minY, maxY) for value in (1, 2, 3)}
 
-        empty = self.__width*self.__height
+    def wallsInRect(self, minX: int, maxX: int, minY: int, maxY: int) -> list[tuple[int, int]]:
+        return self.__spatialIndexes()[WALL].inRect(minX, maxX, minY, maxY)
 
-        maxWalls = int(Map.WALL_MAX_RATIO * empty)
-        maxWalls = maxWalls if self.wallChoices is None else len(self.wallChoices)
+    def playersInRect(self, minX: int, maxX: int, minY: int, maxY: int) -> list[tuple[int, int]]:
+        return self.__spatialIndexes()[PLAYER].inRect(minX, maxX, minY, maxY)
 
-        minWalls = int(Map.WALL_MIN_RATIO * empty)
-        minWalls = 0 if maxWalls < minWalls else minWalls
+    def nearestCoin(self, loc: tuple[int, int]) -> Optional[tuple[int, int]]:
+        """
+        :return: position of the coin closest to loc by manhattan distance, None when no coins are left
+        """
+        indexes = self.__spatialIndexes()
+        best = None
+        for code in (COIN1, COIN2, COIN3):
+            found = indexes[code].nearest(loc, None if best is None else best[1])
+            if found is not None and (best is None or (found[1], found[0]) < (best[1], best[0])):
+                best = found
+        return None if best is None else best[0]
 
-        numWalls = random.randint(minWalls, maxWalls)
-        wallChoices = deepcopy(self.wallChoices)
-        for _ in range(numWalls):
-            self.__placeRandom(Wall(), wallChoices)
+    def __spatialIndexes(self) -> list[Optional[SpatialIndex]]:
+        if self.__indexes is None:
+            self.__indexes = [None]
+            for code in (WALL, COIN1, COIN2, COIN3):
+                index = SpatialIndex()
+                index.addArrays(*np.nonzero(self.__grid == code))
+                self.__indexes.append(index)
+            index = SpatialIndex()
+            index.addArrays(*np.nonzero(self.__grid >= PLAYER))
+            self.__indexes.append(index)
+        return self.__indexes
 
-        # Fill players
-        for player in players:
-            player.loc = self.__placeRandom(player)
+    def player(self, code: int) -> Player:
+        return self.__players[code - PLAYER]
+
+    def playerCode(self, player: Player) -> int:
+        """
+        :return: cell code of player, registering the player in the player table if needed
+        """
+        playerId = self.__playerIds.get(player)
+        if playerId is None:
+            playerId = self.__playerIds[player] = len(self.__players)
+            self.__players.append(player)
+        return PLAYER + playerId
+
+    def __encode(self, item: object) -> int:
+        if item is None:
+            return EMPTY
+        elif isinstance(item, Player):
+            return self.playerCode(item)
+        elif isinstance(item, Wall):
+            return WALL
+        elif isinstance(item, Coin):
+            return COIN1 + item.value - 1
+        raise TypeError(f'{item!r} cannot be placed on the map')
+
+    def __fillMap(self, players: list[Player], rng: np.random.Generator, wallDensity: Optional[float] = None):
+        """
+        Places walls, players and coins on distinct cells drawn without replacement, so no draw is ever rejected
+        """
+        assert isinstance(players, list)
+
+        cells = self.__width*self.__height
+        assert len(players) <= cells, 'the board is too small for all players'
+        flat = self.__grid.reshape(-1)
+
+        if self.wallChoices is None:
+            candidates = getScaledWallMask(self.__height, self.__width).reshape(-1)
+        else:
+            choices = np.asarray(self.wallChoices, dtype=np.int64).reshape(-1, 2)
+            inside = (0 <= choices[:, 0]) & (choices[:, 0] < self.__height) & \
+                     (0 <= choices[:, 1]) & (choices[:, 1] < self.__width)
+            candidates = np.zeros(cells, dtype=bool)
+            candidates[choices[inside, 0] * self.__width + choices[inside, 1]] = True
+        wallCells = np.flatnonzero(candidates)
+        maxWalls = len(wallCells)
+
+        if wallDensity is None:
+            minWalls = int(Map.WALL_MIN_RATIO * cells)
+            minWalls = 0 if maxWalls < minWalls else minWalls
+            numWalls = min(int(rng.integers(minWalls, maxWalls, endpoint=True)), cells - len(players))
+        else:
+            numWalls = min(int(wallDensity * cells), maxWalls, cells - len(players))
+        flat[rng.choice(wallCells, numWalls, replace=False)] = WALL
 
         numPlayers = len(players)
-        empty = empty - numWalls - numPlayers
-
-        self.__numCoins = random.randint(int(Map.COIN_MIN_RATIO * empty), int(Map.COIN_MAX_RATIO * empty))
-        for _ in range(self.__numCoins):
-            coin = random.choices((Coin1, Coin2, Coin3), (6,3,1))[0]()
-            self.__placeRandom(coin)
-
-    def __placeRandom(self, obj, choice: Optional[list] = None):
-        while True:
-            if choice is None:
-                x, y = random.randint(0, self.__height - 1), random.randint(0, self.__width - 1)
-            else:
-                x, y = random.choice(choice)
-                choice.remove((x,y))
-            if self.__map[x][y] is None:
-                self.__map[x][y] = obj
-                return x, y
+        empty = cells - numWalls - numPlayers
+        numCoins = int(rng.integers(int(Map.COIN_MIN_RATIO * empty), int(Map.COIN_MAX_RATIO * empty), endpoint=True))
+
+        # Players take the first free cells drawn, coins the rest
+        free = np.flatnonzero(flat == EMPTY)
+        picks = free[rng.choice(len(free), numPlayers + numCoins, replace=False)]
+        for player, cell in zip(players, picks[:numPlayers].tolist()):
+            flat[cell] = self.playerCode(player)
+            player.loc = divmod(cell, self.__width)
+        flat[picks[numPlayers:]] = rng.choice(np.array([COIN1, COIN2, COIN3], dtype=np.uint16), numCoins,
+                                              p=(0.6, 0.3, 0.1))
 
 
 if __name__ == '__main__':
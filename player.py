@@ -9,6 +9,8 @@ if TYPE_CHECKING:
 
 
 class Player:
+    __slots__ = ('__name', '__team', '__loc')
+
     def __init__(self, playerName: str, team: Team):
         assert isinstance(playerName, str)
 
@@ -32,3 +34,8 @@ class Player:
     def loc(self, value: tuple[int,int]):
         assert isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], int) and isinstance(value[1], int)
         self.__loc = value
+
+
+if not __debug__:
+    # Without asserts there is nothing to check, so loc is the slot itself and moves skip the property call
+    Player.loc = Player._Player__loc
@@ -0,0 +1,111 @@
+"""
+Headless game runner: plays games between bots in process with no MQTT, and spreads many games over all cores
+Usage: python simulation.py --games 1000 --teams 2 --players 2 --bot algorithm
+"""
+
+import time
+import argparse
+import statistics
+from multiprocessing import Pool
+from typing import Optional
+
+from bots import BOTS, Bot
+from game import Game
+
+
+def playGame(playerNames: dict[str, list[str]], bots: dict[str, Bot], width: int = 10, height: int = 10,
+             seed: Optional[int] = None, maxRounds: int = 1000, visionRadius: int = 2) -> dict:
+    """
+    Plays one game until all coins are collected or maxRounds rounds have been played
+    :param bots: {playerName: Bot, ...} for every player
+    :return: {seed: int, rounds: int, finished: bool, scores: {teamName: score, ...}}
+    """
+    game = Game(playerNames, width, height, seed)
+    rounds = 0
+    while not game.gameOver() and rounds < maxRounds:
+        gameData = game.getAllGameData(visionRadius)
+        game.applyMoves({name: bot.move(gameData[name]) for name, bot in bots.items()})
+        rounds += 1
+    return {'seed': game.seed, 'rounds': rounds, 'finished': game.gameOver(), 'scores': game.getScores()}
+
+
+def playConfig(config: dict, seed: int) -> dict:
+    """
+    Plays one game of a picklable configuration, see runGames
+    """
+    width, height = config.get('width', 10), config.get('height', 10)
+    policies = config['policies']
+    names = [name for team in config['teams'].values() for name in team]
+    bots = {}
+    for i, name in enumerate(names):
+        policy = policies[name] if isinstance(policies, dict) else policies
+        bots[name] = BOTS[policy](height, width, seed=(seed << 32) + i, visionRadius=config.get('visionRadius', 2))
+    return playGame(config['teams'], bots, width, height, seed, config.get('maxRounds', 1000),
+                    config.get('visionRadius', 2))
+
+
+def _playSeed(args: tuple[dict, int]) -> dict:
+    return playConfig(*args)
+
+
+def runGames(config: dict, numGames: int, processes: Optional[int] = None, seed: int = 0) -> dict:
+    """
+    Plays numGames games of config across a process pool, game i uses seed + i
+    :param config: {teams: {teamName: [playerName, ...]}, policies: bot name or {playerName: bot name},
+                    width: int, height: int, maxRounds: int, visionRadius: int}
+    :param processes: worker processes, all cores when None and in process when 1
+    :return: {games, seconds, gamesPerSecond, finished, rounds: {mean, median, max}, scores: {teamName: {...}}}
+    """
+    start = time.perf_counter()
+    jobs = [(config, seed + i) for i in range(numGames)]
+    if processes == 1:
+        results = list(map(_playSeed, jobs))
+    else:
+        with Pool(processes) as pool:
+            results = pool.map(_playSeed, jobs, chunksize=max(1, numGames // 64))
+    seconds = time.perf_counter() - start
+
+    rounds = [result['rounds'] for result in results]
+    scores = {}
+    for team in config['teams']:
+        teamScores = [result['scores'][team] for result in results]
+        wins = sum(1 for result in results if result['scores'][team] == max(result['scores'].values()))
+        scores[team] = {'mean': statistics.mean(teamScores), 'stdev': statistics.pstdev(teamScores),
+                        'min': min(teamScores), 'max': max(teamScores), 'wins': wins}
+    return {'games': numGames,
+            'seconds': seconds,
+            'gamesPerSecond': numGames / seconds,
+            'finished': sum(result['finished'] for result in results),
+            'rounds': {'mean': statistics.mean(rounds), 'median': statistics.median(rounds), 'max': max(rounds)},
+            'scores': scores}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, all cores by default')
+    parser.add_argument('--teams', type=int, default=2)
+    parser.add_argument('--players', type=int, default=2, help='players per team')
+    parser.add_argument('--bot', default='algorithm', choices=sorted(BOTS))
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--height', type=int, default=10)
+    parser.add_argument('--max-rounds', type=int, default=1000)
+    parser.add_argument('--vision', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = {'teams': {f'Team{t}': [f'Team{t}Player{p}' for p in range(args.players)] for t in range(args.teams)},
+              'policies': args.bot,
+              'width': args.width,
+              'height': args.height,
+              'maxRounds': args.max_rounds,
+              'visionRadius': args.vision}
+    stats = runGames(config, args.games, args.processes, args.seed)
+
+    print(f"{stats['games']} games in {stats['seconds']:.2f}s: {stats['gamesPerSecond']:.1f} games/s, "
+          f"{stats['finished']} finished before {args.max_rounds} rounds")
+    print(f"rounds/game: mean {stats['rounds']['mean']:.1f}, median {stats['rounds']['median']}, "
+          f"max {stats['rounds']['max']}")
+    for team, score in stats['scores'].items():
+        print(f"{team}: mean {score['mean']:.2f} +- {score['stdev']:.2f}, range {score['min']}-{score['max']}, "
+              f"{score['wins']} wins")
@@ -0,0 +1,130 @@
+from typing import Iterable, Iterator, Optional
+import numpy as np
+
+
+class SpatialIndex:
+    """
+    Set of grid positions bucketed into square tiles, so rectangle and nearest queries only visit nearby tiles
+    """
+
+    def __init__(self, locs: Iterable[tuple[int, int]] = (), bucketSize: int = 8):
+        assert isinstance(bucketSize, int) and bucketSize > 0
+        self.__size = bucketSize
+        self.__buckets: dict[tuple[int, int], set[tuple[int, int]]] = {}
+        self.__count = 0
+        # Bounding box of the buckets ever used, limits how far nearest() searches
+        self.__bounds: Optional[list[int]] = None
+        for loc in locs:
+            self.add(loc)
+
+    def __len__(self):
+        return self.__count
+
+    def __contains__(self, loc: tuple[int, int]):
+        bucket = self.__buckets.get((loc[0] // self.__size, loc[1] // self.__size))
+        return bucket is not None and loc in bucket
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        for bucket in self.__buckets.values():
+            yield from bucket
+
+    def add(self, loc: tuple[int, int]):
+        key = (loc[0] // self.__size, loc[1] // self.__size)
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            bucket = self.__buckets[key] = set()
+            if self.__bounds is None:
+                self.__bounds = [key[0], key[0], key[1], key[1]]
+            else:
+                bounds = self.__bounds
+                bounds[0], bounds[1] = min(bounds[0], key[0]), max(bounds[1], key[0])
+                bounds[2], bounds[3] = min(bounds[2], key[1]), max(bounds[3], key[1])
+        if loc not in bucket:
+            bucket.add(loc)
+            self.__count += 1
+
+    def addArrays(self, xs: np.ndarray, ys: np.ndarray):
+        """
+        Bulk add of the positions (xs[i], ys[i]), grouping them into buckets with NumPy
+        """
+        if len(xs) == 0:
+            return
+        bucketXs, bucketYs = xs // self.__size, ys // self.__size
+        order = np.lexsort((bucketYs, bucketXs))
+        xs, ys, bucketXs, bucketYs = xs[order], ys[order], bucketXs[order], bucketYs[order]
+        starts = np.flatnonzero((np.diff(bucketXs) != 0) | (np.diff(bucketYs) != 0)) + 1
+        bounds = [bucketXs[0], bucketXs[-1], bucketYs.min(), bucketYs.max()]
+        if self.__bounds is not None:
+            bounds = [min(bounds[0], self.__bounds[0]), max(bounds[1], self.__bounds[1]),
+                      min(bounds[2], self.__bounds[2]), max(bounds[3], self.__bounds[3])]
+        self.__bounds = [int(bound) for bound in bounds]
+
+        locs = list(zip(xs.tolist(), ys.tolist()))
+        starts = [0] + starts.tolist()
+        keys = zip(bucketXs[starts].tolist(), bucketYs[starts].tolist())
+        for key, start, end in zip(keys, starts, starts[1:] + [len(locs)]):
+            bucket = self.__buckets.setdefault(key, set())
+            before = len(bucket)
+            bucket.update(locs[start:end])
+            self.__count += len(bucket) - before
+
+    def discard(self, loc: tuple[int, int]):
+        bucket = self.__buckets.get((loc[0] // self.__size, loc[1] // self.__size))
+        if bucket is not None and loc in bucket:
+            bucket.remove(loc)
+            self.__count -= 1
+
+    def inRect(self, minX: int, maxX: int, minY: int, maxY: int) -> list[tuple[int, int]]:
+        """
+        :return: positions inside the inclusive bounds in row major order
+        """
+        result = []
+        size = self.__size
+        for bucketX in range(minX // size, maxX // size + 1):
+            for bucketY in range(minY // size, maxY // size + 1):
+                bucket = self.__buckets.get((bucketX, bucketY))
+                if not bucket:
+                    continue
+                if minX <= bucketX * size and (bucketX + 1) * size - 1 <= maxX and \
+                        minY <= bucketY * size and (bucketY + 1) * size - 1 <= maxY:
+                    result.extend(bucket)
+                else:
+                    result.extend(loc for loc in bucket if minX <= loc[0] <= maxX and minY <= loc[1] <= maxY)
+        result.sort()
+        return result
+
+    def nearest(self, loc: tuple[int, int], within: Optional[int] = None) -> Optional[tuple[tuple[int, int], int]]:
+        """
+        Searches rings of buckets around loc, skipping buckets that cannot hold a closer position
+        :param within: only consider positions at most this far away
+        :return: (position, manhattan distance) of the closest position, ties broken by position, None if none found
+        """
+        if self.__count == 0:
+            return None
+        size = self.__size
+        x, y = loc
+        centerX, centerY = x // size, y // size
+        minBX, maxBX, minBY, maxBY = self.__bounds
+        maxRing = max(centerX - minBX, maxBX - centerX, centerY - minBY, maxBY - centerY)
+        best = None
+        limit = float('inf') if within is None else within
+        for ring in range(maxRing + 1):
+            # Every position in this ring is at least this far away
+            if (ring - 1) * size + 1 > limit:
+                break
+            for bucketX in range(centerX - ring, centerX + ring + 1):
+                step = 1 if abs(bucketX - centerX) == ring else 2 * ring
+                for bucketY in range(centerY - ring, centerY + ring + 1, step):
+                    bucket = self.__buckets.get((bucketX, bucketY))
+                    if not bucket:
+                        continue
+                    lowerBound = max(bucketX * size - x, 0, x - bucketX * size - size + 1) + \
+                        max(bucketY * size - y, 0, y - bucketY * size - size + 1)
+                    if lowerBound > limit:
+                        continue
+                    for other in bucket:
+                        distance = abs(other[0] - x) + abs(other[1] - y)
+                        if distance < limit or distance == limit and (best is None or other < best[0]):
+                            best = (other, distance)
+                            limit = distance
+        return best
@@ -0,0 +1,113 @@
+"""
+Delta encoding of the per player game data: each message only carries what changed since the last state the
+client acknowledged, with a full keyframe every few messages so a client that lost messages catches up
+"""
+
+from typing import Optional
+
+# Position lists of the game data that are sent as added/removed sets
+SET_KEYS = ('coin1', 'coin2', 'coin3', 'walls', 'enemyPositions')
+# Short names of the sets in delta messages, most messages are only a few entries so the names matter
+WIRE_KEYS = {'coin1': 'c1', 'coin2': 'c2', 'coin3': 'c3', 'walls': 'w', 'enemyPositions': 'e', 'teammates': 't'}
+
+
+def _sets(gameData: dict) -> dict[str, set]:
+    sets = {key: {tuple(loc) for loc in gameData[key]} for key in SET_KEYS}
+    sets['teammates'] = {(name, *loc) for name, loc in zip(gameData['teammateNames'], gameData['teammatePositions'])}
+    return sets
+
+
+class DeltaEncoder:
+    def __init__(self, keyframeInterval: int = 20):
+        """
+        :param keyframeInterval: a player gets a full state at least once every keyframeInterval messages
+        """
+        assert isinstance(keyframeInterval, int) and keyframeInterval > 0
+        self.keyframeInterval = keyframeInterval
+        self.__seq: dict[str, int] = {}
+        self.__lastKeyframe: dict[str, int] = {}
+        # Last acknowledged (seq, sets) and the sets of the messages sent since, by player
+        self.__acked: dict[str, tuple[int, dict[str, set]]] = {}
+        self.__pending: dict[str, dict[int, dict[str, set]]] = {}
+
+    def encode(self, playerName: str, gameData: dict) -> dict:
+        """
+        :return: keyframe {seq, state: gameData} or
+                 delta {seq, base: seq the delta applies to, pos: currentPosition, add: {key: [...]}, del: {key: [...]}}
+                 where key is a WIRE_KEYS value, teammates entries are [name, x, y] and only keys with changes are
+                 present
+        """
+        seq = self.__seq[playerName] = self.__seq.get(playerName, 0) + 1
+        sets = _sets(gameData)
+        pending = self.__pending.setdefault(playerName, {})
+        pending[seq] = sets
+        if len(pending) > self.keyframeInterval:
+            del pending[min(pending)]
+
+        acked = self.__acked.get(playerName)
+        if acked is None or seq - self.__lastKeyframe[playerName] >= self.keyframeInterval:
+            self.__lastKeyframe[playerName] = seq
+            return {'seq': seq, 'state': gameData}
+
+        base, baseSets = acked
+        added, removed = {}, {}
+        for key, locs in sets.items():
+            if locs != baseSets[key]:
+                if locs - baseSets[key]:
+                    added[WIRE_KEYS[key]] = sorted(locs - baseSets[key])
+                if baseSets[key] - locs:
+                    removed[WIRE_KEYS[key]] = sorted(baseSets[key] - locs)
+        return {'seq': seq, 'base': base, 'pos': gameData['currentPosition'], 'add': added, 'del': removed}
+
+    def ack(self, playerName: str, seq: int):
+        """
+        Makes the state sent with seq the base of the following deltas, stale or unknown acks are ignored
+        """
+        pending = self.__pending.get(playerName, {})
+        if seq not in pending:
+            return
+        self.__acked[playerName] = (seq, pending[seq])
+        for old in [old for old in pending if old <= seq]:
+            del pending[old]
+
+
+class DeltaDecoder:
+    def __init__(self):
+        # Decoded sets by seq, kept from the oldest base the encoder may still use
+        self.__states: dict[int, dict[str, set]] = {}
+
+    def apply(self, message: dict) -> Optional[dict]:
+        """
+        :param message: message made by DeltaEncoder.encode, after a JSON round trip or not
+        :return: game data in the getGameData layout with positions as lists, None if the delta's base is unknown,
+                 the next keyframe recovers from that
+        """
+        seq = message['seq']
+        if 'state' in message:
+            state = message['state']
+            self.__states = {seq: _sets(state)}
+            return state
+
+        baseSets = self.__states.get(message['base'])
+        if baseSets is None:
+            return None
+        sets = {}
+        for key, locs in baseSets.items():
+            wireKey = WIRE_KEYS[key]
+            if wireKey in message['del']:
+                locs = locs - {tuple(loc) for loc in message['del'][wireKey]}
+            if wireKey in message['add']:
+                locs = locs | {tuple(loc) for loc in message['add'][wireKey]}
+            sets[key] = locs
+        # The encoder never bases a delta on a state older than the base it used last
+        self.__states = {old: states for old, states in self.__states.items() if old >= message['base']}
+        self.__states[seq] = sets
+
+        teammates = sorted(sets['teammates'], key=lambda teammate: teammate[1:])
+        gameData = {'teammateNames': [name for name, _, _ in teammates],
+                    'teammatePositions': [[x, y] for _, x, y in teammates],
+                    'enemyPositions': [],
+                    'currentPosition': list(message['pos'])}
+        for key in SET_KEYS:
+            gameData[key] = [list(loc) for loc in sorted(sets[key])]
+        return gameData
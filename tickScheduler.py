@@ -0,0 +1,88 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Hashable, Optional
+
+
+class TickScheduler:
+    """
+    Deadlines of many keys (lobbies) in one heap. Rescheduled and cancelled deadlines stay in the heap and are skipped
+    when they come up, so every operation is O(log n). Safe to use from several threads
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.__heap: list[tuple[float, int, Hashable]] = []
+        # Current deadline of every scheduled key, heap entries that disagree with it are stale
+        self.__deadlines: dict[Hashable, float] = {}
+        self.__counter = itertools.count()
+        self.__changed = threading.Condition()
+
+    def __len__(self):
+        return len(self.__deadlines)
+
+    def schedule(self, key: Hashable, delay: float):
+        """
+        Sets the deadline of key to delay seconds from now, replacing any earlier one
+        """
+        with self.__changed:
+            deadline = self.clock() + delay
+            self.__deadlines[key] = deadline
+            heapq.heappush(self.__heap, (deadline, next(self.__counter), key))
+            # Compacts the heap once stale entries dominate it
+            if len(self.__heap) > 2 * len(self.__deadlines) + 64:
+                self.__heap = [entry for entry in self.__heap if self.__deadlines.get(entry[2]) == entry[0]]
+                heapq.heapify(self.__heap)
+            self.__changed.notify_all()
+
+    def cancel(self, key: Hashable):
+        with self.__changed:
+            self.__deadlines.pop(key, None)
+
+    def isScheduled(self, key: Hashable) -> bool:
+        return key in self.__deadlines
+
+    def timeUntilNext(self) -> Optional[float]:
+        """
+        :return: seconds until the earliest deadline, 0 if one is due, None if nothing is scheduled
+        """
+        with self.__changed:
+            self.__dropStale()
+            if not self.__heap:
+                return None
+            return max(self.__heap[0][0] - self.clock(), 0)
+
+    def popDue(self) -> list[Hashable]:
+        """
+        Removes and returns the keys whose deadline has passed, earliest first
+        """
+        due = []
+        with self.__changed:
+            now = self.clock()
+            self.__dropStale()
+            while self.__heap and self.__heap[0][0] <= now:
+                _, _, key = heapq.heappop(self.__heap)
+                del self.__deadlines[key]
+                due.append(key)
+                self.__dropStale()
+        return due
+
+    def runForever(self, callback: Callable[[Hashable], None], stop: Optional[threading.Event] = None):
+        """
+        Calls callback(key) for every deadline as it passes, until stop is set. Wakes up early when a sooner deadline
+        is scheduled
+        """
+        while stop is None or not stop.is_set():
+            with self.__changed:
+                delay = self.timeUntilNext()
+                if delay is None or delay > 0:
+                    # Bounded wait so a set stop event is noticed
+                    self.__changed.wait(1 if delay is None else min(delay, 1))
+            for key in self.popDue():
+                callback(key)
+
+    def __dropStale(self):
+        heap = self.__heap
+        while heap and self.__deadlines.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
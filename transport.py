@@ -0,0 +1,225 @@
+"""
+Pluggable MQTT transport: create_client returns either a paho client connected to the broker of credentials.env or a
+LocalClient on an in-memory broker, selected by MQTT_TRANSPORT=paho|local in the environment or credentials.env
+"""
+
+import os
+import queue
+import threading
+import itertools
+
+import paho.mqtt.client as paho
+from paho import mqtt
+from dotenv import load_dotenv
+
+
+class LocalMessage():
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class LocalBroker():
+    def __init__(self):
+        """
+        In-memory pub/sub with MQTT topic filters. Subscriptions are kept in a tree of topic levels, so a publish only
+        visits the branches its levels, + and # lead to
+        """
+        # Every node is [children by level, subscribed clients]
+        self.root = [{}, set()]
+        self.lock = threading.Lock()
+
+    def subscribe(self, client, topic_filter):
+        with self.lock:
+            node = self.root
+            for level in topic_filter.split('/'):
+                node = node[0].setdefault(level, [{}, set()])
+            node[1].add(client)
+
+    def unsubscribe(self, client, topic_filter=None):
+        """
+            Removes one subscription of client, or all of them when topic_filter is None
+        """
+        with self.lock:
+            if topic_filter is not None:
+                node = self.root
+                for level in topic_filter.split('/'):
+                    node = node[0].get(level)
+                    if node is None:
+                        return
+                node[1].discard(client)
+                return
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                node[1].discard(client)
+                stack.extend(node[0].values())
+
+    def subscribers(self, topic):
+        """
+            :return: clients with a subscription matching topic, each once
+        """
+        levels = topic.split('/')
+        found = set()
+        with self.lock:
+            nodes = [self.root]
+            for level in levels:
+                next_nodes = []
+                for node in nodes:
+                    children = node[0]
+                    if '#' in children:
+                        found |= children['#'][1]
+                    for key in (level, '+'):
+                        if key in children:
+                            next_nodes.append(children[key])
+                nodes = next_nodes
+            for node in nodes:
+                found |= node[1]
+                # 'a/#' also matches 'a'
+                if '#' in node[0]:
+                    found |= node[0]['#'][1]
+        return found
+
+    def publish(self, topic, payload):
+        message = LocalMessage(topic, payload)
+        for client in self.subscribers(topic):
+            client.deliver(message)
+
+
+# Broker shared by every LocalClient that is not given one
+LOCAL_BROKER = LocalBroker()
+
+
+class PublishInfo():
+    def __init__(self, mid):
+        self.mid = mid
+        self.rc = 0
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def is_published(self):
+        return True
+
+
+class LocalClient():
+    def __init__(self, client_id="", broker=None):
+        """
+        Stand-in for the parts of paho.Client used here. Messages are delivered on the client's own thread, started by
+        loop_start or run by loop_forever, like paho's network loop
+        """
+        self.client_id = client_id
+        self.broker = LOCAL_BROKER if broker is None else broker
+        self.on_connect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+        self.__inbox = queue.SimpleQueue()
+        self.__thread = None
+        self.__mids = itertools.count(1)
+
+    # Connection settings only matter for a real broker
+    def tls_set(self, *args, **kwargs):
+        pass
+
+    def username_pw_set(self, *args, **kwargs):
+        pass
+
+    def enable_logger(self, *args, **kwargs):
+        pass
+
+    def connect(self, *args, **kwargs):
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0, None)
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        mid = next(self.__mids)
+        self.broker.subscribe(self, topic)
+        if self.on_subscribe is not None:
+            self.on_subscribe(self, None, mid, [qos], None)
+        return 0, mid
+
+    def unsubscribe(self, topic):
+        self.broker.unsubscribe(self, topic)
+        return 0, next(self.__mids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        # The same payload conversion as paho
+        if payload is None:
+            payload = b''
+        elif isinstance(payload, str):
+            payload = payload.encode()
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode()
+        else:
+            payload = bytes(payload)
+        mid = next(self.__mids)
+        self.broker.publish(topic, payload)
+        if self.on_publish is not None:
+            self.on_publish(self, None, mid)
+        return PublishInfo(mid)
+
+    def deliver(self, message):
+        self.__inbox.put(message)
+
+    def loop_start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.loop_forever, daemon=True)
+            self.__thread.start()
+
+    def loop_stop(self):
+        if self.__thread is not None:
+            self.__inbox.put(None)
+            if self.__thread is not threading.current_thread():
+                self.__thread.join()
+            self.__thread = None
+
+    def loop(self, timeout=1.0):
+        """
+            Delivers the messages waiting for this client, waiting up to timeout seconds for the first one
+        """
+        try:
+            message = self.__inbox.get(timeout=timeout)
+            while message is not None:
+                if self.on_message is not None:
+                    self.on_message(self, None, message)
+                message = self.__inbox.get_nowait()
+        except queue.Empty:
+            pass
+        return 0
+
+    def loop_forever(self):
+        for message in iter(self.__inbox.get, None):
+            if self.on_message is not None:
+                self.on_message(self, None, message)
+
+    def disconnect(self):
+        self.broker.unsubscribe(self)
+        self.loop_stop()
+
+
+def create_client(client_id="", address=None, port=None, username=None, password=None, transport=None):
+    """
+        Creates a connected MQTT client, settings that are not given come from the environment and credentials.env
+        :param transport: 'paho' for a broker over the network, 'local' for the in-memory LOCAL_BROKER
+    """
+    load_dotenv(dotenv_path='./credentials.env')
+    transport = transport or os.environ.get('MQTT_TRANSPORT', 'paho')
+    if transport == 'local':
+        client = LocalClient(client_id)
+        client.connect()
+        return client
+    if transport != 'paho':
+        raise ValueError(f'{transport} is not a transport, use paho or local')
+
+    client = paho.Client(callback_api_version=paho.CallbackAPIVersion.VERSION1, client_id=client_id, userdata=None, protocol=paho.MQTTv5)
+    # enable TLS for secure connection, can be turned off with BROKER_TLS=0 for a broker on this machine
+    if os.environ.get('BROKER_TLS', '1') != '0':
+        client.tls_set(tls_version=mqtt.client.ssl.PROTOCOL_TLS)
+    # set username and password
+    client.username_pw_set(username or os.environ.get('USER_NAME'), password or os.environ.get('PASSWORD'))
+    client.connect(address or os.environ.get('BROKER_ADDRESS'), port or int(os.environ.get('BROKER_PORT')))
+    return client
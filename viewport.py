@@ -0,0 +1,87 @@
+import sys
+from typing import Optional, TextIO
+
+# Graphics of the game data entries and of the cells without one
+MARKERS = {
+    'free': '__',
+    'walls': '[]',
+    'oob': 'XX',
+    'coin1': '$1',
+    'coin2': '$2',
+    'coin3': '$3',
+    'enemyPositions': 'ENMY',
+}
+
+
+class Viewport:
+    """
+    Text view of the window a player sees, kept between game states. The rows are preallocated and refilled in place
+    from a cached background, and a game state equal to the last one keeps the rendered text
+    """
+
+    def __init__(self, visionRadius: int = 2, height: int = 10, width: int = 10):
+        """
+        :param visionRadius: radius of the game data window, the viewport grows if the game data reaches further
+        :param height: board height, cells beyond the board are drawn as out of bounds
+        :param width: board width
+        """
+        self.height = height
+        self.width = width
+        self.__resize(visionRadius)
+
+    def __resize(self, visionRadius: int):
+        self.visionRadius = visionRadius
+        side = 2 * visionRadius + 1
+        # Graphic of every cell, rows are refilled in place
+        self.cells = [[MARKERS['free']] * side for _ in range(side)]
+        self.__text: Optional[str] = None
+        self.__gameData: Optional[dict] = None
+        # Free and out of bounds cells by how far the window sticks out of each board edge
+        self.__backgrounds: dict[tuple[int, int, int, int], list[list[str]]] = {}
+
+    def update(self, playerName: str, gameData: dict):
+        """
+        Redraws the window around gameData['currentPosition'], nothing is redrawn when gameData is the same as the last
+        """
+        if gameData == self.__gameData:
+            return
+        x, y = gameData['currentPosition']
+        if self.__gameData is None:
+            # The window size of a game never changes, the first game data tells if it is bigger than expected
+            reach = max((max(abs(locX - x), abs(locY - y)) for key, locs in gameData.items()
+                         if key not in ('teammateNames', 'currentPosition') for locX, locY in locs), default=0)
+            if reach > self.visionRadius:
+                self.__resize(reach)
+        self.__gameData = gameData
+        self.__text = None
+
+        top, left = x - self.visionRadius, y - self.visionRadius
+        cells = self.cells
+        for row, background in zip(cells, self.__backgroundAt(top, left)):
+            row[:] = background
+        for key in ('walls', 'coin1', 'coin2', 'coin3', 'enemyPositions'):
+            marker = MARKERS[key]
+            for locX, locY in gameData[key]:
+                cells[locX - top][locY - left] = marker
+        for name, (locX, locY) in zip(gameData['teammateNames'], gameData['teammatePositions']):
+            cells[locX - top][locY - left] = name.capitalize()
+        cells[x - top][y - left] = playerName.capitalize()
+
+    def render(self, title: str = '', out: TextIO = None):
+        """
+        Writes the title and the window with a single write, the window is only joined again after a redraw
+        """
+        if self.__text is None:
+            self.__text = '\n'.join(['\t'.join(row) for row in self.cells])
+        (out or sys.stdout).write(f"{title}\n{self.__text}\n")
+
+    def __backgroundAt(self, top: int, left: int) -> list[list[str]]:
+        side = 2 * self.visionRadius + 1
+        # Only how far the window sticks out of the board matters
+        key = (max(-top, 0), max(top + side - self.height, 0), max(-left, 0), max(left + side - self.width, 0))
+        background = self.__backgrounds.get(key)
+        if background is None:
+            background = self.__backgrounds[key] = [
+                [MARKERS['free'] if 0 <= top + i < self.height and 0 <= left + j < self.width else MARKERS['oob']
+                 for j in range(side)] for i in range(side)]
+        return background
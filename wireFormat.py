@@ -0,0 +1,245 @@
+"""
+Binary encoding of game_state, scores, board and move payloads, the compact alternative to the JSON messages.
+Every game_state and scores payload starts with a format byte, which is never '{', so they can be told apart from JSON
+"""
+
+import struct
+
+import numpy as np
+
+from gameItems import *
+from map import MapSnapshot
+from moveset import Moveset
+
+# Format bytes
+WINDOW = 1  # game_state as a window of 3 bit cell kinds around the player
+PAIRS = 2   # game_state as lists of uint16 (x, y) pairs, smaller when the window is mostly empty
+SCORES = 3
+BOARD = 4
+BOARD_DELTA = 5  # the cells of a board that changed since the previous frame
+
+HEADER = struct.Struct('<BHHB')  # format, currentPosition x, y, vision radius
+COUNTS = struct.Struct('<6H')
+PAIR = struct.Struct('<HH')
+SCORE = struct.Struct('<i')
+BOARD_HEADER = struct.Struct('<BBIHHIH')  # format, flags, frame number, height, width, number of items, number of players
+BOARD_DELTA_HEADER = struct.Struct('<BBII')  # format, flags, frame number, number of cells
+# Board flags
+BOARD_RLE = 1
+BOARD_WIDE = 2
+
+# Cell kinds follow the cell codes, enemies are PLAYER and teammates PLAYER + 1 as in Game.getAllGameData
+KIND_KEYS = (None, 'walls', 'coin1', 'coin2', 'coin3', 'enemyPositions', 'teammatePositions')
+MOVES = tuple(Moveset)
+
+
+def encodeGameData(gameData: dict, visionRadius: int) -> bytes:
+    """
+    :param gameData: getGameData of a player, every position within visionRadius of currentPosition
+    :return: header, then the cells as a WINDOW or PAIRS body, whichever is smaller, then the teammate names as
+             uint8 length + utf-8 in row major order
+    """
+    x, y = gameData['currentPosition']
+    side = 2 * visionRadius + 1
+    numCells = side * side
+    numEntities = sum(len(gameData[key]) for key in KIND_KEYS[1:])
+    names = b''.join(bytes((len(name),)) + name for name in (name.encode() for name in gameData['teammateNames']))
+
+    if (numCells * 3 + 7) // 8 < COUNTS.size + PAIR.size * numEntities:
+        # Cell i of the row major window is bits 3i to 3i+2 of a little endian integer
+        window = 0
+        for kind, key in enumerate(KIND_KEYS[1:], WALL):
+            for locX, locY in gameData[key]:
+                window |= kind << 3 * ((locX - x + visionRadius) * side + locY - y + visionRadius)
+        body = window.to_bytes((numCells * 3 + 7) // 8, 'little')
+        return HEADER.pack(WINDOW, x, y, visionRadius) + body + names
+
+    counts = COUNTS.pack(*(len(gameData[key]) for key in KIND_KEYS[1:]))
+    pairs = b''.join(PAIR.pack(*loc) for key in KIND_KEYS[1:] for loc in gameData[key])
+    return HEADER.pack(PAIRS, x, y, visionRadius) + counts + pairs + names
+
+
+def decodeGameData(payload: bytes) -> dict:
+    """
+    :return: the getGameData dict of encodeGameData, with positions as lists like a decoded JSON message
+    """
+    fmt, x, y, visionRadius = HEADER.unpack_from(payload)
+    offset = HEADER.size
+    gameData = {'teammateNames': [],
+                'teammatePositions': [],
+                'enemyPositions': [],
+                'currentPosition': [x, y],
+                'coin1': [],
+                'coin2': [],
+                'coin3': [],
+                'walls': []}
+
+    if fmt == WINDOW:
+        side = 2 * visionRadius + 1
+        numCells = side * side
+        size = (numCells * 3 + 7) // 8
+        window = payload[offset:offset + size]
+        offset += size
+        # Every 3 bytes hold 8 cells, empty groups are skipped
+        for start in range(0, size, 3):
+            group = int.from_bytes(window[start:start + 3], 'little')
+            cell = start // 3 * 8
+            while group:
+                kind = group & 7
+                if kind:
+                    row, col = divmod(cell, side)
+                    gameData[KIND_KEYS[kind]].append([x + row - visionRadius, y + col - visionRadius])
+                group >>= 3
+                cell += 1
+    elif fmt == PAIRS:
+        counts = COUNTS.unpack_from(payload, offset)
+        offset += COUNTS.size
+        for key, count in zip(KIND_KEYS[1:], counts):
+            gameData[key] = [list(loc) for loc in PAIR.iter_unpack(payload[offset:offset + count * PAIR.size])]
+            offset += count * PAIR.size
+    else:
+        raise ValueError(f'{fmt} is not a game_state format')
+
+    for _ in gameData['teammatePositions']:
+        length = payload[offset]
+        gameData['teammateNames'].append(payload[offset + 1:offset + 1 + length].decode())
+        offset += 1 + length
+    return gameData
+
+
+def encodeScores(scores: dict[str, int]) -> bytes:
+    """
+    :return: format byte, uint8 team count, then uint8 length + utf-8 name + int32 score per team
+    """
+    payload = bytearray((SCORES, len(scores)))
+    for team, score in scores.items():
+        name = team.encode()
+        payload += bytes((len(name),)) + name + SCORE.pack(score)
+    return bytes(payload)
+
+
+def decodeScores(payload: bytes) -> dict[str, int]:
+    if payload[0] != SCORES:
+        raise ValueError(f'{payload[0]} is not the scores format')
+    scores = {}
+    offset = 2
+    for _ in range(payload[1]):
+        length = payload[offset]
+        team = payload[offset + 1:offset + 1 + length].decode()
+        scores[team] = SCORE.unpack_from(payload, offset + 1 + length)[0]
+        offset += 1 + length + SCORE.size
+    return scores
+
+
+def encodeMove(move: Moveset) -> bytes:
+    return bytes((MOVES.index(move),))
+
+
+def decodeMove(payload: bytes) -> Moveset:
+    """
+    :raises ValueError: if payload is not a single move byte
+    """
+    if len(payload) != 1 or payload[0] >= len(MOVES):
+        raise ValueError(f'{payload!r} is not a binary move')
+    return MOVES[payload[0]]
+
+
+def encodeBoard(snapshot: MapSnapshot, scores: dict[str, int], frame: int = 0) -> bytes:
+    """
+    :param frame: number of the frame, the BOARD_DELTA frames following it count up from there
+    :return: header, the player names as uint8 length + utf-8 in cell code order, the row major cell codes, then the
+             encodeScores payload. The codes are run-length encoded (code, length) pairs when that is smaller than one
+             item per cell, and items are uint8 unless a player code needs uint16
+    """
+    flat = snapshot.codes.reshape(-1)
+    itemType = np.uint8 if PLAYER + len(snapshot.players) <= 0xFF else np.dtype('<u2')
+    maxRun = np.iinfo(itemType).max
+    starts = np.flatnonzero(np.concatenate(([True], flat[1:] != flat[:-1])))
+    lengths = np.diff(np.append(starts, len(flat)))
+    # Runs longer than an item can hold are split into full runs and a remainder
+    pieces = (lengths + maxRun - 1) // maxRun
+
+    flags = BOARD_WIDE if itemType != np.uint8 else 0
+    if 2 * pieces.sum() < len(flat):
+        codes = np.repeat(flat[starts], pieces)
+        runs = np.full(len(codes), maxRun, dtype=np.int64)
+        runs[np.cumsum(pieces) - 1] = lengths - (pieces - 1) * maxRun
+        items = np.empty((len(codes), 2), dtype=itemType)
+        items[:, 0], items[:, 1] = codes, runs
+        flags |= BOARD_RLE
+    else:
+        items = flat.astype(itemType)
+
+    names = [player.name.encode() for player in snapshot.players]
+    return BOARD_HEADER.pack(BOARD, flags, frame, snapshot.height, snapshot.width, len(items), len(names)) + \
+        b''.join(bytes((len(name),)) + name for name in names) + items.tobytes() + encodeScores(scores)
+
+
+def decodeBoard(payload: bytes) -> dict:
+    """
+    :return: {frame: frame number, codes: (height, width) array of cell codes,
+              players: [name for code PLAYER, PLAYER + 1, ...], scores: {teamName: score, ...}}
+    """
+    fmt, flags, frame, height, width, numItems, numPlayers = BOARD_HEADER.unpack_from(payload)
+    if fmt != BOARD:
+        raise ValueError(f'{fmt} is not the board format')
+    offset = BOARD_HEADER.size
+    players = []
+    for _ in range(numPlayers):
+        length = payload[offset]
+        players.append(payload[offset + 1:offset + 1 + length].decode())
+        offset += 1 + length
+
+    itemType = np.dtype('<u2') if flags & BOARD_WIDE else np.dtype(np.uint8)
+    if flags & BOARD_RLE:
+        items = np.frombuffer(payload, dtype=itemType, count=2 * numItems, offset=offset).reshape(-1, 2)
+        codes = np.repeat(items[:, 0], items[:, 1])
+    else:
+        items = codes = np.frombuffer(payload, dtype=itemType, count=numItems, offset=offset)
+    return {'frame': frame,
+            'codes': codes.astype(np.uint16).reshape(height, width),
+            'players': players,
+            'scores': decodeScores(payload[offset + items.nbytes:])}
+
+
+def encodeBoardDelta(frame: int, cells: list[tuple[int, int]], codes: list[int], width: int,
+                     scores: dict[str, int]) -> bytes:
+    """
+    :param frame: number of this frame, one more than the frame it changes
+    :param cells: (x, y) of the cells that changed, codes holds their new codes
+    :return: header, the uint32 row major indexes of the cells, their codes as uint8 unless one needs uint16, then the
+             encodeScores payload
+    """
+    itemType = np.uint8 if max(codes, default=0) <= 0xFF else np.dtype('<u2')
+    indexes = np.array([x * width + y for x, y in cells], dtype='<u4')
+    return BOARD_DELTA_HEADER.pack(BOARD_DELTA, BOARD_WIDE if itemType != np.uint8 else 0, frame, len(indexes)) + \
+        indexes.tobytes() + np.array(codes, dtype=itemType).tobytes() + encodeScores(scores)
+
+
+def decodeBoardDelta(payload: bytes) -> dict:
+    """
+    :return: {frame: frame number, cells: row major indexes of the changed cells, codes: their codes,
+              scores: {teamName: score, ...}}
+    """
+    fmt, flags, frame, numCells = BOARD_DELTA_HEADER.unpack_from(payload)
+    if fmt != BOARD_DELTA:
+        raise ValueError(f'{fmt} is not the board delta format')
+    offset = BOARD_DELTA_HEADER.size
+    cells = np.frombuffer(payload, dtype='<u4', count=numCells, offset=offset)
+    offset += cells.nbytes
+    codes = np.frombuffer(payload, dtype=np.dtype('<u2') if flags & BOARD_WIDE else np.uint8, count=numCells,
+                          offset=offset)
+    return {'frame': frame, 'cells': cells, 'codes': codes, 'scores': decodeScores(payload[offset + codes.nbytes:])}
+
+
+def applyBoardDelta(board: dict, delta: dict) -> bool:
+    """
+    Updates a decodeBoard board with the frame following it
+    :return: False, leaving board as it is, if delta does not follow the frame of board
+    """
+    if delta['frame'] != board['frame'] + 1:
+        return False
+    board['codes'].reshape(-1)[delta['cells']] = delta['codes']
+    board['frame'] = delta['frame']
+    board['scores'] = delta['scores']
+    return True